@@ -1,160 +1,224 @@
-from flask import Flask, render_template, Response, jsonify, request
-import cv2
-from ultralytics import YOLO
-import numpy as np
-from datetime import datetime
+from flask import Flask, render_template, Response, jsonify, request, make_response, send_file, url_for, abort
+import json
 import os
-import traceback
-import pandas as pd
-import time
-from components.pose_estimations import PoseEstimator, available_poses
+import re
+from components.pose_estimations import ALL_POSES, available_poses
+from components.pipeline import BatchInference
+from components.sessions import SessionManager
+from components.exports import ExportManager
+from components.adaptive import AdaptiveController
+from components.inference import PoseModel
+from components.sources import VideoSource, parse_sources
 
 app = Flask(__name__)
 
-# YOLOv8モデルをロード
-model = YOLO('yolov8n-pose.pt')
+# YOLOv8モデル（最初に使うときに読み込む）
+# KOJI_MODEL（重み）, KOJI_BACKEND（torch/onnx/openvino）, KOJI_IMGSZ（入力サイズ）, KOJI_THREADS（スレッド数）で設定
+model = PoseModel.from_env()
 
-# カメラキャプチャの設定
-camera = cv2.VideoCapture(0)
-
-# FPSを30に設定
+# カメラキャプチャの設定（最初のフレームを読み込むときに開く）
+# KOJI_SOURCES でカメラ番号・ストリームのURL・動画ファイルをカンマ区切りで複数指定できる（既定はカメラ 0）
 FPS = 30
-FRAME_INTERVAL = 1.0 / FPS
+SOURCES = parse_sources(os.environ.get('KOJI_SOURCES', '0'))
+
+# ファイルを保存するディレクトリを指定（環境変数 KOJI_SAVE_DIR で変更可能）
+SAVE_DIR = os.environ.get('KOJI_SAVE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'exports'))
+os.makedirs(SAVE_DIR, exist_ok=True)
+
+# セッションデータの書き出しジョブ
+export_manager = ExportManager()
+
+# 評価セッション（ブラウザごと）の管理。姿勢推定の状態はセッションと人物ごとに持つ
+session_manager = SessionManager(SAVE_DIR)
+
+# 人物ごとにキーポイントの揺れを抑えるフィルター（KOJI_SMOOTHING=0 で無効）
+SMOOTHING = os.environ.get('KOJI_SMOOTHING', '1') == '1'
+
+# 各段の処理時間などの計測値はカメラごとに記録する（/metrics で参照、KOJI_METRICS_OVERLAY=1 で映像にも表示）
+METRICS_OVERLAY = os.environ.get('KOJI_METRICS_OVERLAY') == '1'
+
+# 遅延に応じて映像の品質と推論の頻度を自動調整（KOJI_ADAPTIVE=1 で有効、目標遅延は KOJI_TARGET_LATENCY 秒）
+controller = None
+if os.environ.get('KOJI_ADAPTIVE') == '1':
+    controller = AdaptiveController(target_latency=float(os.environ.get('KOJI_TARGET_LATENCY', 0.15)))
 
-# セッションデータを保存するグローバル変数
-session_data = []
+# 複数のカメラがある場合は、各カメラの最新フレームをまとめて1回で推論する
+inference = BatchInference(model, controller) if len(SOURCES) > 1 else None
 
-# PoseEstimatorのインスタンスを作成
-pose_estimator = PoseEstimator()
+# カメラごとの映像パイプライン（クライアントが何人いても推論はフレームごとに1回）
+# 人物の追跡・平滑化・姿勢の評価もカメラごとに行う
+sources = {source_id: VideoSource(source_id, source, model, session_manager, fps=FPS, smoothing=SMOOTHING,
+                                  overlay=METRICS_OVERLAY, controller=controller, inference=inference)
+           for source_id, source in SOURCES}
+DEFAULT_SOURCE = SOURCES[0][0]
 
-# 選択された姿勢推定メソッド
-selected_pose = 'right_hand_raised'
+# 画面で選択できる姿勢（すべての姿勢を同時に評価するモードを含む）
+pose_labels = {**available_poses, ALL_POSES: 'All Poses (Auto)'}
 
-def generate_frames():
-    global session_data, selected_pose
-    last_frame_time = time.time()
-    while True:
-        current_time = time.time()
-        elapsed_time = current_time - last_frame_time
+def current_session():
+    # CookieのセッションIDに対応するセッションを取得
+    session_id = request.cookies.get('session_id') or session_manager.new_id()
+    return session_manager.get(session_id)
 
-        if elapsed_time >= FRAME_INTERVAL:
-            success, frame = camera.read()
-            if not success:
+def get_source(source_id):
+    # URLで指定されたカメラ（省略時は最初のカメラ）
+    source = sources.get(source_id or DEFAULT_SOURCE)
+    if source is None:
+        abort(404)
+    return source
+
+def generate_frames(session, source, fps=None):
+    # 姿勢の完了などの結果は /events で送る。fps を指定するとそのフレームレートまで間引く
+    pipeline = source.pipeline
+    subscriber = pipeline.subscribe()
+    session.open_stream(source.source_id)
+    last_sent = 0.0
+    try:
+        while True:
+            packet = subscriber.get()
+            if packet is None:
                 break
-            else:
-                # YOLOv8による推論を実行
-                results = model(frame)
-                
-                # 結果を描画
-                annotated_frame = results[0].plot()
-                
-                # 骨格データを抽出し整理
-                skeleton_data = []
-                timestamp = datetime.now().timestamp()
-                stop_recording = False
-                for result in results:
-                    for pose in result.keypoints.data:
-                        organized_data = pose_estimator.organize_skeleton_data(pose.tolist(), timestamp)
-                        skeleton_data.append(organized_data)
-                        
-                        # 選択された姿勢推定メソッドを実行
-                        if selected_pose == 'right_hand_raised':
-                            stop_recording = pose_estimator.check_pose(organized_data, current_time)
-                        elif selected_pose == 't_pose':
-                            stop_recording = pose_estimator.is_t_pose(organized_data['keypoints'])
-                
-                if stop_recording:
-                    print(f"Detected {available_poses[selected_pose]}. Stopping video.")
-                    yield (b'--frame\r\n'
-                           b'Content-Type: text/plain\r\n\r\n'
-                           b'COMPLETE\r\n')
-                    break
-                
-                # セッションデータに追加
-                session_data.extend(skeleton_data)
-                
-                # JPEGにエンコード
-                ret, buffer = cv2.imencode('.jpg', annotated_frame)
-                frame = buffer.tobytes()
-                
-                last_frame_time = current_time
-                
-                yield (b'--frame\r\n'
-                       b'Content-Type: image/jpeg\r\n\r\n' + frame + b'\r\n')
-        else:
-            time.sleep(max(0, FRAME_INTERVAL - elapsed_time))
+            if fps and packet.captured_at - last_sent < 1.0 / fps:
+                continue
+            last_sent = packet.captured_at
+
+            yield (b'--frame\r\n'
+                   b'Content-Type: image/jpeg\r\n\r\n' + packet.jpeg + b'\r\n')
+            subscriber.mark_delivered(packet)
+    finally:
+        session.close_stream()
+        pipeline.unsubscribe(subscriber)
+
+def server_sent_event(event, data):
+    return f'event: {event}\ndata: {json.dumps(data, ensure_ascii=False, separators=(",", ":"))}\n\n'
+
+def generate_events(session, source):
+    # 推論したフレームごとにキーポイントと姿勢の確からしさを送り、姿勢が完了したら完了イベントを送る
+    pipeline = source.pipeline
+    subscriber = pipeline.subscribe(results=True)
+    session.open_stream(source.source_id)
+    announced = set()  # 完了を通知済みの姿勢（すべての姿勢を評価するモード）
+    try:
+        while True:
+            packet = subscriber.get()
+            if packet is None:
+                break
+            message = session.frame_event(packet)
+            yield server_sent_event('frame', message)
+            for pose in message['completed_poses']:
+                if pose not in announced:
+                    announced.add(pose)
+                    yield server_sent_event('pose_completed', {'pose': pose, 'label': available_poses[pose]})
+            if message['completed']:
+                yield server_sent_event('complete', {'pose': session.selected_pose,
+                                                     'label': pose_labels[session.selected_pose]})
+                break
+    finally:
+        session.close_stream()
+        pipeline.unsubscribe(subscriber)
 
 @app.route('/')
 def index():
-    return render_template('index.html', poses=available_poses)
+    session_id = request.cookies.get('session_id') or session_manager.new_id()
+    session_manager.get(session_id)
+    # ページを開いた時点でモデルの読み込みとウォームアップを始めておく
+    model.warmup_async()
+    source_id = request.args.get('source', DEFAULT_SOURCE)
+    response = make_response(render_template('index.html', poses=pose_labels, sources=sources,
+                                             selected_source=source_id if source_id in sources else DEFAULT_SOURCE))
+    response.set_cookie('session_id', session_id, samesite='Lax')
+    return response
 
 @app.route('/video_feed')
-def video_feed():
-    return Response(generate_frames(),
+@app.route('/video_feed/<source_id>')
+def video_feed(source_id=None):
+    # ?fps=5 のように指定すると低いフレームレートで配信する
+    source = get_source(source_id)
+    fps = request.args.get('fps', type=float)
+    return Response(generate_frames(current_session(), source, fps),
                     mimetype='multipart/x-mixed-replace; boundary=frame')
 
+@app.route('/events')
+@app.route('/events/<source_id>')
+def events(source_id=None):
+    # 姿勢判定の結果を Server-Sent Events で配信する（映像とは別の軽量なチャンネル）
+    source = get_source(source_id)
+    return Response(generate_events(current_session(), source), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/metrics')
+def metrics_endpoint():
+    # JSON（既定）または Prometheus のテキスト形式（?format=prometheus）で計測値を返す
+    # 最初のカメラの計測値を最上位に置き、カメラが複数あれば sources にカメラごとの計測値を入れる
+    if request.args.get('format') == 'prometheus':
+        if len(sources) == 1:
+            text = sources[DEFAULT_SOURCE].metrics.prometheus()
+        else:
+            # カメラごとにメトリクス名の接頭辞を分ける（例: koji_front_stage_seconds）
+            text = ''.join(source.metrics.prometheus(prefix='koji_' + re.sub(r'\W', '_', source_id))
+                           for source_id, source in sources.items())
+        return Response(text, mimetype='text/plain; version=0.0.4')
+    snapshot = sources[DEFAULT_SOURCE].metrics.snapshot()
+    if len(sources) > 1:
+        snapshot['sources'] = {source_id: {**source.to_dict(), **source.metrics.snapshot()}
+                               for source_id, source in sources.items()}
+    snapshot['model'] = model.to_dict()
+    if controller is not None:
+        snapshot['adaptive'] = controller.to_dict()
+    return jsonify(snapshot)
+
 @app.route('/set_pose', methods=['POST'])
 def set_pose():
-    global selected_pose
     selected_pose = request.form.get('pose')
-    return jsonify({'message': f'Pose set to {available_poses[selected_pose]}'})
+    if selected_pose not in pose_labels:
+        return jsonify({'message': f'Unknown pose: {selected_pose}'}), 400
+    current_session().set_pose(selected_pose)
+    return jsonify({'message': f'Pose set to {pose_labels[selected_pose]}'})
+
+@app.route('/pose_status')
+def pose_status():
+    # 人物ごと・姿勢ごとの確からしさと完了までの進み具合（/events を使わないクライアント用）
+    return jsonify(current_session().status_dict())
 
 @app.route('/stop_and_save', methods=['POST'])
 def stop_and_save():
-    global session_data
-    try:
-        if not session_data:
-            return jsonify({'message': 'No data to save. Please start the video feed first.'}), 400
-
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        
-        # ファイルを保存するディレクトリを指定
-        save_dir = r'C:\Users\81809\Documents\学校\適当\yolotest'
-        
-        print(f"Session data length: {len(session_data)}")
-        print(f"First item in session data: {session_data[0] if session_data else 'No data'}")
-        
-        # データを整理
-        organized_data = []
-        for item in session_data:
-            keypoints = item['keypoints']
-            keypoint_dict = {kp['name']: (kp['x'], kp['y']) for kp in keypoints if kp['confidence'] > 0.5}
-            organized_data.append({'timestamp': item['timestamp'], **keypoint_dict})
-        
-        # DataFrameに変換
-        df = pd.DataFrame(organized_data)
-        
-        if df.empty:
-            return jsonify({'message': 'No valid data to save.'}), 400
-        
-        # タイムスタンプでソート
-        df = df.sort_values('timestamp')
-        
-        # X座標とY座標を別々の列に分割
-        for column in df.columns:
-            if column != 'timestamp':
-                df[f'{column}_x'] = df[column].apply(lambda x: x[0] if isinstance(x, tuple) else None)
-                df[f'{column}_y'] = df[column].apply(lambda x: x[1] if isinstance(x, tuple) else None)
-                df = df.drop(column, axis=1)
-        
-        # 列を並び替え
-        columns = ['timestamp'] + sorted([col for col in df.columns if col != 'timestamp'])
-        df = df[columns]
-        
-        # Excelファイルとして保存
-        excel_filename = f'keypoints_data_{timestamp}.xlsx'
-        excel_path = os.path.join(save_dir, excel_filename)
-        df.to_excel(excel_path, index=False)
-        
-        # セッションデータをリセット
-        session_data = []
-        
-        print(f"Session data saved successfully as {excel_path}")
-        return jsonify({'message': f'Session data saved as {excel_filename}'})
-    except Exception as e:
-        error_msg = f"Error saving session data: {str(e)}\n{traceback.format_exc()}"
-        print(error_msg)
-        return jsonify({'error': error_msg}), 500
+    # 記録中のNPYファイルを閉じ、XLSX/CSVへの書き出しはバックグラウンドで行う
+    export_format = request.form.get('format', 'xlsx')
+    if export_format not in ('xlsx', 'csv'):
+        return jsonify({'message': f'Unsupported format: {export_format}'}), 400
+
+    recording_path = current_session().finish_recording()
+    if recording_path is None:
+        return jsonify({'message': 'No data to save. Please start the video feed first.'}), 400
+
+    print(f"Session data recorded in {recording_path}")
+    output_path = os.path.splitext(recording_path)[0] + '.' + export_format
+    job = export_manager.submit(recording_path, output_path)
+    return jsonify({
+        'message': f'Saving session data as {os.path.basename(output_path)}',
+        'job_id': job.job_id,
+        'status_url': url_for('export_status', job_id=job.job_id),
+        'download_url': url_for('export_download', job_id=job.job_id),
+    }), 202
+
+@app.route('/export_status/<job_id>')
+def export_status(job_id):
+    job = export_manager.get(job_id)
+    if job is None:
+        return jsonify({'message': 'Unknown job.'}), 404
+    return jsonify(job.to_dict())
+
+@app.route('/export_download/<job_id>')
+def export_download(job_id):
+    job = export_manager.get(job_id)
+    if job is None:
+        return jsonify({'message': 'Unknown job.'}), 404
+    if job.status != 'done':
+        return jsonify({'message': 'Export is not ready.', **job.to_dict()}), 409
+    return send_file(job.output_path, as_attachment=True)
 
 if __name__ == '__main__':
+    # KOJI_WARMUP=1 なら最初のアクセスを待たずに起動時からウォームアップする
+    if os.environ.get('KOJI_WARMUP') == '1' and os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        model.warmup_async()
     app.run(debug=True)
\ No newline at end of file
@@ -0,0 +1,60 @@
+# 録画済みの動画・画像フォルダを一括で処理するコマンドラインツール
+#
+# 例: python batch.py recordings/*.mp4 --output results --workers 4
+# 記録したキーポイント（.npy）を渡すと推論せずに採点し直す
+#     python batch.py exports/*.npy --threshold-angle 20
+
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from components.inference import BACKENDS, THREAD_BACKENDS, PoseModel
+from components.offline import init_worker, process_in_worker
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run YOLOv8 pose estimation and pose checks over recorded videos or frame folders.')
+    parser.add_argument('inputs', nargs='+', help='video files, directories of frames or recorded keypoints (.npy)')
+    parser.add_argument('--output', default='batch_output', help='directory for keypoints (.npy) and verdicts (.csv)')
+    parser.add_argument('--model', default='yolov8n-pose.pt', help='YOLOv8 pose model')
+    parser.add_argument('--backend', default='torch', choices=BACKENDS, help='inference backend (exports the model if needed)')
+    parser.add_argument('--threads', type=int, help='inference threads per worker (torch backend only)')
+    parser.add_argument('--batch-size', type=int, default=16, help='frames per model call')
+    parser.add_argument('--workers', type=int, default=1, help='number of worker processes')
+    parser.add_argument('--fps', type=float, default=30, help='frame rate for frame folders')
+    parser.add_argument('--preview', action='store_true', help='also write annotated preview videos')
+    parser.add_argument('--no-smoothing', action='store_true', help='evaluate the raw keypoints without smoothing')
+    parser.add_argument('--tolerance', type=float, help='neck flexion tolerance (fraction of shoulder width)')
+    parser.add_argument('--hip-tolerance', type=float, help='hands-on-hips tolerance (fraction of shoulder width)')
+    parser.add_argument('--threshold-angle', type=float, help='neck angle tolerance in degrees')
+    parser.add_argument('--back-tolerance', type=float, help='back-straight tolerance in degrees')
+    args = parser.parse_args()
+    if args.threads and args.backend not in THREAD_BACKENDS:
+        parser.error(f'--threads is only supported by the {", ".join(THREAD_BACKENDS)} backend')
+
+    os.makedirs(args.output, exist_ok=True)
+    if not all(path.endswith('.npy') for path in args.inputs):
+        # ワーカーが同時に書き出さないように、必要ならここでバックエンド用のモデルを書き出しておく
+        PoseModel(args.model, args.backend).export()
+    params = {name: getattr(args, name) for name in ('tolerance', 'hip_tolerance', 'threshold_angle', 'back_tolerance')
+              if getattr(args, name) is not None}
+    job_args = (args.output, args.batch_size, args.fps, args.preview, not args.no_smoothing, params)
+
+    if args.workers <= 1:
+        init_worker(args.model, args.backend, args.threads)
+        for path in args.inputs:
+            print(process_in_worker(path, *job_args))
+        return
+
+    # ファイル単位でプロセスプールに分散する
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=init_worker, initargs=(args.model, args.backend, args.threads)) as executor:
+        futures = {executor.submit(process_in_worker, path, *job_args): path for path in args.inputs}
+        for future in as_completed(futures):
+            try:
+                print(future.result())
+            except Exception as e:
+                print(f"Error processing {futures[future]}: {e}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,181 @@
+# 姿勢推定パイプラインの各段の処理時間・メモリを計測するベンチマーク
+# カメラやネットワークは不要（モデルは合成キーポイントを返すスタブ、または --model で指定したローカルのモデル）
+#
+# 例: python -m benchmarks.bench_pipeline
+#     python -m benchmarks.bench_pipeline --model yolov8n-pose.pt --frames recordings/session.mp4 --json bench.json
+
+import argparse
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+
+import cv2
+import numpy as np
+
+from benchmarks.fixtures import (
+    StubPoseModel, load_frames, load_model, synthetic_frame, synthetic_keypoints
+)
+from components.inference import BACKENDS
+from components.keypoints import keypoints_to_array
+from components.pose_estimations import PoseEstimator
+from components.renderer import draw_skeleton
+from components.recorder import SessionRecorder, export_recording, load_recording, recording_to_dataframe
+from components.tracking import KeypointTracker
+
+
+def summarize(times, peak_bytes):
+    times_ms = np.array(times) * 1000
+    mean = times_ms.mean()
+    return {
+        'p50_ms': round(float(np.percentile(times_ms, 50)), 3),
+        'p90_ms': round(float(np.percentile(times_ms, 90)), 3),
+        'p99_ms': round(float(np.percentile(times_ms, 99)), 3),
+        'mean_ms': round(float(mean), 3),
+        'fps': round(1000 / mean, 1) if mean else float('inf'),
+        'peak_kib': round(peak_bytes / 1024, 1),
+    }
+
+
+def measure(fn, repeat, warmup=3):
+    # 処理時間はトレースなしで計測し、ピークメモリは別に少ない回数で計測する
+    for _ in range(warmup):
+        fn()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    for _ in range(max(1, min(repeat, 10))):
+        fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return summarize(times, peak)
+
+
+def bench_frame_stages(model, people, repeat):
+    # 1フレーム分の各段を計測（people は1フレームに写る人数）
+    frame = synthetic_frame()
+    keypoints = synthetic_keypoints(people)
+    results = model(frame, verbose=False)
+    estimators = [PoseEstimator() for _ in range(people)]
+    batch_estimator = PoseEstimator()
+    tracker = KeypointTracker()
+    annotated_frame = results[0].plot()
+    clock = [0.0]
+
+    def detectors():
+        clock[0] += 1 / 30
+        for estimator, pose in zip(estimators, keypoints):
+            estimator.check_pose(pose, clock[0])
+            estimator.neck_flexion(pose, timestamp=clock[0])
+            estimator.lateral_flexion_neck(pose, timestamp=clock[0])
+            estimator.neck_rotation(pose, timestamp=clock[0])
+            estimator.neck_extension(pose, timestamp=clock[0])
+
+    def track():
+        clock[0] += 1 / 30
+        tracker.update(keypoints, clock[0])
+
+    stages = {
+        'inference': lambda: model(frame, verbose=False),
+        'plot': lambda: results[0].plot(),
+        'render': lambda: [draw_skeleton(frame, pose) for pose in keypoints],
+        'keypoints_to_array': lambda: keypoints_to_array(results[0].keypoints.data),
+        'organize_skeleton_data': lambda: [batch_estimator.organize_skeleton_data(pose, 0.0) for pose in keypoints],
+        'detectors': detectors,
+        'evaluate_batch': lambda: batch_estimator.evaluate_batch(keypoints),
+        'tracking': track,
+        'imencode': lambda: cv2.imencode('.jpg', annotated_frame),
+    }
+    return {name: measure(fn, repeat) for name, fn in stages.items()}
+
+
+def bench_session_export(frames, people, output_dir):
+    # セッションの記録と stop_and_save の書き出しを計測（frames はセッションのフレーム数）
+    keypoints = synthetic_keypoints(people, frames=frames)
+    track_ids = list(range(people))
+    path = os.path.join(output_dir, f'bench_{frames}.npy')
+
+    def record():
+        recorder = SessionRecorder(path)
+        for index in range(frames):
+            recorder.append(index / 30, track_ids, keypoints[index])
+        recorder.close()
+
+    record()
+    return {
+        'record': measure(record, 3, warmup=0),
+        'to_dataframe': measure(lambda: recording_to_dataframe(load_recording(path)), 3, warmup=0),
+        'export_csv': measure(lambda: export_recording(path, path[:-4] + '.csv'), 3, warmup=0),
+    }
+
+
+def bench_end_to_end(model, frames):
+    # 録画済みフレームを使い、推論から判定・描画・エンコードまでを通しで計測
+    tracker = KeypointTracker()
+    estimators = {}
+    index = [0]
+
+    def step():
+        frame = frames[index[0] % len(frames)]
+        timestamp = index[0] / 30
+        index[0] += 1
+        results = model(frame, verbose=False)
+        keypoints = keypoints_to_array(results[0].keypoints.data)
+        for track_id, pose in zip(tracker.update(keypoints, timestamp), keypoints):
+            estimators.setdefault(track_id, PoseEstimator()).check_pose(pose, timestamp)
+            draw_skeleton(frame, pose)
+        cv2.imencode('.jpg', frame)
+
+    return measure(step, len(frames))
+
+
+def print_table(title, rows):
+    print(f'\n## {title}')
+    print(f"{'stage':<28}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'fps':>10}{'peak KiB':>12}")
+    for name, stats in rows.items():
+        print(f"{name:<28}{stats['p50_ms']:>10}{stats['p90_ms']:>10}{stats['p99_ms']:>10}{stats['fps']:>10}{stats['peak_kib']:>12}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the pose pipeline stages.')
+    parser.add_argument('--model', help='local YOLOv8 pose model (default: synthetic stub model)')
+    parser.add_argument('--backend', default='torch', choices=BACKENDS, help='inference backend for --model')
+    parser.add_argument('--frames', help='recorded video or frame folder for the end-to-end benchmark')
+    parser.add_argument('--people', default='1,2,4,8,16', help='people-per-frame sweep')
+    parser.add_argument('--session-lengths', default='300,3000,30000', help='session length sweep (frames)')
+    parser.add_argument('--repeat', type=int, default=200, help='iterations per stage')
+    parser.add_argument('--json', help='write the results to this JSON file')
+    args = parser.parse_args()
+
+    real_model = load_model(args.model, args.backend)
+    report = {'model': args.model if real_model else 'stub', 'backend': args.backend, 'frame_stages': {}, 'session_export': {}}
+
+    for people in [int(v) for v in args.people.split(',')]:
+        model = real_model or StubPoseModel(people)
+        rows = bench_frame_stages(model, people, args.repeat)
+        report['frame_stages'][people] = rows
+        print_table(f'{people} people per frame', rows)
+
+    with tempfile.TemporaryDirectory() as output_dir:
+        for frames in [int(v) for v in args.session_lengths.split(',')]:
+            rows = bench_session_export(frames, 2, output_dir)
+            report['session_export'][frames] = rows
+            print_table(f'session of {frames} frames (2 people)', rows)
+
+    if args.frames:
+        rows = {'end_to_end': bench_end_to_end(real_model or StubPoseModel(2), load_frames(args.frames))}
+        report['end_to_end'] = rows['end_to_end']
+        print_table(f'end to end ({args.frames})', rows)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
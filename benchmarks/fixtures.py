@@ -0,0 +1,93 @@
+# ベンチマーク用の合成データ（カメラ・ネットワーク不要）
+
+import os
+
+import cv2
+import numpy as np
+
+from components.keypoints import KEYPOINT_NAMES
+from components.renderer import SKELETON_INDEX
+
+# 正面を向いて立っている人の標準的なキーポイント（640×480の画面、x, y）
+STANDING_POSE = np.array([
+    [320, 100],  # nose
+    [310, 90], [330, 90],  # eyes
+    [300, 95], [340, 95],  # ears
+    [280, 150], [360, 150],  # shoulders
+    [260, 210], [380, 210],  # elbows
+    [250, 270], [390, 270],  # wrists
+    [295, 270], [345, 270],  # hips
+    [295, 350], [345, 350],  # knees
+    [295, 430], [345, 430],  # ankles
+], dtype=np.float32)
+
+
+def synthetic_keypoints(people, frames=None, seed=0, jitter=3.0):
+    # (people, 17, 3) または (frames, people, 17, 3) の合成キーポイントを生成
+    rng = np.random.default_rng(seed)
+    shape = (people,) if frames is None else (frames, people)
+    offsets = rng.uniform(-200, 200, size=shape + (1, 2)).astype(np.float32)
+    xy = STANDING_POSE + offsets + rng.normal(0, jitter, size=shape + (len(KEYPOINT_NAMES), 2)).astype(np.float32)
+    confidence = rng.uniform(0.3, 1.0, size=shape + (len(KEYPOINT_NAMES), 1)).astype(np.float32)
+    return np.concatenate([xy, confidence], axis=-1)
+
+
+def synthetic_frame(seed=0, width=640, height=480):
+    # 推論を行わない経路用のランダムな画像
+    rng = np.random.default_rng(seed)
+    return rng.integers(0, 255, size=(height, width, 3), dtype=np.uint8)
+
+
+def load_frames(path, limit=300):
+    # 録画済みの動画または画像フォルダからフレームを読み込む（エンドツーエンド計測用）
+    from components.offline import iter_frames
+    frames = []
+    for _, _, frame in iter_frames(path):
+        frames.append(frame)
+        if len(frames) >= limit:
+            break
+    return frames
+
+
+class StubKeypoints:
+    def __init__(self, data):
+        self.data = data
+
+
+class StubResult:
+    # ultralytics の Results のうち、アプリが使う部分だけを再現したもの
+    def __init__(self, frame, keypoints):
+        self.orig_img = frame
+        self.keypoints = StubKeypoints(keypoints)
+
+    def plot(self):
+        # results[0].plot() と同様に、画像のコピーへ骨格を描画する
+        image = self.orig_img.copy()
+        for person in self.keypoints.data:
+            for start, end in SKELETON_INDEX:
+                cv2.line(image, tuple(int(v) for v in person[start, :2]), tuple(int(v) for v in person[end, :2]), (255, 0, 0), 2)
+            for x, y, _ in person:
+                cv2.circle(image, (int(x), int(y)), 5, (0, 255, 0), -1)
+        return image
+
+
+class StubPoseModel:
+    # 一定人数の合成キーポイントを返すモデルの代わり
+    def __init__(self, people=1, seed=0):
+        self.keypoints = synthetic_keypoints(people, seed=seed)
+
+    def __call__(self, frames, **kwargs):
+        if isinstance(frames, np.ndarray):
+            frames = [frames]
+        return [StubResult(frame, self.keypoints) for frame in frames]
+
+
+def load_model(path, backend='torch'):
+    # ローカルのモデルファイルがあれば実際のモデルを使う（計測の前にウォームアップする）
+    if path and os.path.exists(path):
+        from components.inference import PoseModel
+        model = PoseModel(path, backend)
+        if not model.warmup():
+            raise RuntimeError(f'Could not load {path}: {model.error}')
+        return model
+    return None
@@ -0,0 +1,70 @@
+# 処理の遅れに合わせて映像の品質と推論の頻度を調整するコントローラー
+
+import threading
+import time
+
+
+class StreamSettings:
+    # 1段階分の設定
+    def __init__(self, imgsz, stride, jpeg_quality, scale):
+        self.imgsz = imgsz  # 推論の入力サイズ
+        self.stride = stride  # 何フレームに1回推論するか（間のフレームは直前のキーポイントを使う）
+        self.jpeg_quality = jpeg_quality
+        self.scale = scale  # 出力解像度の倍率
+
+    def to_dict(self):
+        return {'imgsz': self.imgsz, 'stride': self.stride, 'jpeg_quality': self.jpeg_quality, 'scale': self.scale}
+
+
+# 上ほど高品質。遅延が目標を超えると1段ずつ下げ、余裕があれば1段ずつ戻す
+DEFAULT_LEVELS = [
+    StreamSettings(640, 1, 90, 1.0),
+    StreamSettings(640, 1, 80, 1.0),
+    StreamSettings(480, 1, 75, 1.0),
+    StreamSettings(480, 2, 70, 0.75),
+    StreamSettings(416, 2, 65, 0.75),
+    StreamSettings(320, 3, 60, 0.5),
+    StreamSettings(256, 4, 50, 0.5),
+]
+
+
+class AdaptiveController:
+    def __init__(self, target_latency=0.15, levels=None, smoothing=0.1, interval=1.0):
+        self.target_latency = target_latency  # 目標とするカメラ取得からエンコード完了までの時間（秒）
+        self.levels = levels or DEFAULT_LEVELS
+        self.smoothing = smoothing  # 遅延の指数移動平均の係数
+        self.interval = interval  # 段階を変えてから次に変えるまでの最短時間（秒）
+        self.level = 0
+        self.latency = None
+        self.last_change = 0.0
+        self.lock = threading.Lock()
+
+    @property
+    def settings(self):
+        return self.levels[self.level]
+
+    def observe(self, latency):
+        # フレームごとの遅延を受け取り、必要なら段階を変える
+        with self.lock:
+            if self.latency is None:
+                self.latency = latency
+            else:
+                self.latency += self.smoothing * (latency - self.latency)
+
+            now = time.time()
+            if now - self.last_change < self.interval:
+                return
+            if self.latency > self.target_latency * 1.1 and self.level < len(self.levels) - 1:
+                self.level += 1
+                self.last_change = now
+            elif self.latency < self.target_latency * 0.6 and self.level > 0:
+                self.level -= 1
+                self.last_change = now
+
+    def to_dict(self):
+        return {
+            'level': self.level,
+            'latency_ms': round((self.latency or 0.0) * 1000, 1),
+            'target_latency_ms': round(self.target_latency * 1000, 1),
+            **self.settings.to_dict(),
+        }
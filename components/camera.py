@@ -0,0 +1,57 @@
+# カメラを最初にフレームを読み込むときに開く（アプリの起動時にはカメラを開かない）
+# 動画ファイルは記録時のフレームレートで読み込み、最後まで読んだら閉じる（次に読み込むときは先頭から開き直す）
+
+import os
+import threading
+import time
+
+import cv2
+
+
+class LazyCamera:
+    # cv2.VideoCapture と同じ read() / release() を持つ
+    def __init__(self, source=0, fps=30):
+        self.source = source  # カメラ番号、デバイスのパス、動画ファイル、ストリームのURL、または GStreamer のパイプライン
+        self.fps = fps
+        self.capture = None
+        self.frame_interval = None  # 動画ファイルのフレーム間隔（秒）。カメラやストリームは None
+        self.next_frame_at = None
+        self.lock = threading.Lock()
+
+    def is_file(self):
+        # 通常のファイルだけを動画ファイルとして扱う（/dev/video0 などのデバイスや GStreamer のパイプラインはカメラと同じ）
+        return isinstance(self.source, str) and os.path.isfile(self.source)
+
+    def open(self):
+        with self.lock:
+            if self.capture is None:
+                self.capture = cv2.VideoCapture(self.source)
+                if self.is_file():
+                    file_fps = self.capture.get(cv2.CAP_PROP_FPS)
+                    self.frame_interval = 1.0 / (file_fps if file_fps and file_fps > 0 else self.fps)
+                else:
+                    self.capture.set(cv2.CAP_PROP_FPS, self.fps)
+                    # 古いフレームがカメラのバッファに溜まらないようにする
+                    self.capture.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+                self.next_frame_at = None
+            return self.capture
+
+    def read(self):
+        success, frame = self.open().read()
+        if not success:
+            # 動画ファイルの終わりやカメラの切断。閉じておき、次に読み込むときに開き直す
+            self.release()
+            return success, frame
+        if self.frame_interval is not None:
+            # 動画ファイルはすぐに読めるので、記録時の間隔まで待つ（遅れた場合は待たずに次から間隔を空ける）
+            now = time.perf_counter()
+            if self.next_frame_at is not None and self.next_frame_at > now:
+                time.sleep(self.next_frame_at - now)
+            self.next_frame_at = max(self.next_frame_at or 0.0, time.perf_counter()) + self.frame_interval
+        return success, frame
+
+    def release(self):
+        with self.lock:
+            if self.capture is not None:
+                self.capture.release()
+                self.capture = None
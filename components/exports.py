@@ -0,0 +1,73 @@
+# セッションの書き出し（XLSX/CSV）をバックグラウンドで実行し、進捗を管理する
+
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from components.recorder import export_recording
+
+
+class ExportJob:
+    def __init__(self, recording_path, output_path):
+        self.job_id = uuid.uuid4().hex
+        self.recording_path = recording_path
+        self.output_path = output_path
+        self.status = 'pending'  # pending / running / done / failed
+        self.progress = 0.0
+        self.rows = 0
+        self.error = None
+        self.created_at = time.time()
+        self.finished_at = None
+
+    def to_dict(self):
+        return {
+            'job_id': self.job_id,
+            'status': self.status,
+            'progress': round(self.progress, 2),
+            'rows': self.rows,
+            'error': self.error,
+        }
+
+
+class ExportManager:
+    # 書き出しをスレッドプールに渡し、ジョブIDで状態を参照できるようにする
+    def __init__(self, max_workers=2, keep_seconds=24 * 3600):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='export')
+        self.keep_seconds = keep_seconds  # 完了したジョブの情報を保持する秒数
+        self.jobs = {}
+        self.lock = threading.Lock()
+
+    def submit(self, recording_path, output_path):
+        job = ExportJob(recording_path, output_path)
+        now = time.time()
+        with self.lock:
+            for stale_id in [jid for jid, j in self.jobs.items()
+                             if j.finished_at is not None and now - j.finished_at > self.keep_seconds]:
+                del self.jobs[stale_id]
+            self.jobs[job.job_id] = job
+        self.executor.submit(self._run, job)
+        return job
+
+    def get(self, job_id):
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def _run(self, job):
+        job.status = 'running'
+        try:
+            job.rows = export_recording(job.recording_path, job.output_path,
+                                        progress=lambda value: setattr(job, 'progress', value))
+            if job.rows == 0:
+                job.status = 'failed'
+                job.error = 'No valid data to save.'
+            else:
+                job.status = 'done'
+                print(f"Session data saved successfully as {job.output_path}")
+        except Exception as e:
+            job.status = 'failed'
+            job.error = f"Error saving session data: {str(e)}"
+            print(f"{job.error}\n{traceback.format_exc()}")
+        finally:
+            job.finished_at = time.time()
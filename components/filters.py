@@ -0,0 +1,75 @@
+# 人物ごと・関節ごとにキーポイントの揺れを抑えるフィルター（One Euro Filter）
+# 全員・全関節をまとめてNumPyで計算する。信頼度の低い関節は一定時間だけ直前の位置を使い続ける
+
+import math
+
+import numpy as np
+
+
+def _alpha(cutoff, dt):
+    # カットオフ周波数 cutoff（Hz）の一次ローパスフィルターの係数
+    r = 2 * math.pi * cutoff * dt
+    return r / (r + 1)
+
+
+class KeypointFilter:
+    def __init__(self, min_cutoff=1.0, beta=0.05, derivative_cutoff=1.0, min_confidence=0.5, max_carry=0.5,
+                 max_age=1.0):
+        self.min_cutoff = min_cutoff  # 静止しているときのカットオフ周波数（Hz）。小さいほど強く平滑化する
+        self.beta = beta  # 速度（ピクセル/秒）に応じてカットオフを上げる係数。大きいほど速い動きに遅れない
+        self.derivative_cutoff = derivative_cutoff  # 速度の平滑化のカットオフ周波数（Hz）
+        self.min_confidence = min_confidence  # これ以下の信頼度の関節は検出値を使わない
+        self.max_carry = max_carry  # 信頼度の低い関節で直前の位置を使い続ける最大の秒数
+        self.max_age = max_age  # この秒数見えなかった人物の状態を破棄する
+        self.tracks = {}  # track_id -> (平滑化した位置, 検出値の位置, 速度, 信頼度, 最後に信頼できた時刻, 時刻)
+
+    def update(self, keypoints, track_ids, timestamp):
+        # (N, 17, 3) のキーポイントを平滑化し、(N, 17, 3) のキーポイントと (N, 17, 2) の速度（ピクセル/秒）を返す
+        keypoints = np.asarray(keypoints, dtype=np.float32)
+        xy = keypoints[..., :2]
+        confidence = keypoints[..., 2]
+        confident = confidence > self.min_confidence
+
+        # 前回の状態を集める（初めての人物は今回の検出値から始める）
+        previous_xy = xy.copy()
+        previous_raw = xy.copy()
+        previous_velocity = np.zeros_like(xy)
+        previous_confidence = confidence.copy()
+        last_confident = np.full(confidence.shape, -np.inf)
+        previous_time = np.full(len(keypoints), timestamp, dtype=np.float64)
+        known = np.zeros(len(keypoints), dtype=bool)
+        for person, track_id in enumerate(track_ids):
+            state = self.tracks.get(track_id)
+            if state is not None:
+                known[person] = True
+                (previous_xy[person], previous_raw[person], previous_velocity[person], previous_confidence[person],
+                 last_confident[person], previous_time[person]) = state
+        dt = np.maximum(timestamp - previous_time, 1e-3)[:, None, None]
+
+        # 検出値の差分から速度を求めて平滑化し、速いほどカットオフを上げて位置を平滑化する
+        velocity = previous_velocity + _alpha(self.derivative_cutoff, dt) * ((xy - previous_raw) / dt - previous_velocity)
+        cutoff = self.min_cutoff + self.beta * np.linalg.norm(velocity, axis=-1, keepdims=True)
+        smoothed = previous_xy + _alpha(cutoff, dt) * (xy - previous_xy)
+
+        # 信頼度の低い関節は max_carry 秒までは直前の位置を使い、それを過ぎたら検出値からやり直す
+        # （再び信頼できるようになった関節も、その時点の検出値からやり直す）
+        carry = ~confident & known[:, None] & (timestamp - last_confident <= self.max_carry)
+        restart = (~confident & ~carry) | (confident & (previous_confidence <= self.min_confidence))
+        smoothed = np.where(carry[..., None], previous_xy, np.where(restart[..., None], xy, smoothed))
+        raw = np.where(carry[..., None], previous_raw, xy)
+        velocity = np.where((carry | restart)[..., None], 0.0, velocity).astype(np.float32)
+        confidence = np.where(carry, previous_confidence, confidence)
+        last_confident = np.where(confident, timestamp, last_confident)
+
+        for person, track_id in enumerate(track_ids):
+            self.tracks[track_id] = (smoothed[person], raw[person], velocity[person], confidence[person],
+                                     last_confident[person], timestamp)
+        # 一定時間見えなかった人物の状態を破棄
+        for track_id in [t for t, state in self.tracks.items() if timestamp - state[-1] > self.max_age]:
+            del self.tracks[track_id]
+
+        filtered = np.concatenate([smoothed, confidence[..., None]], axis=-1).astype(np.float32)
+        return filtered, velocity
+
+    def reset(self):
+        self.tracks = {}
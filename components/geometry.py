@@ -0,0 +1,70 @@
+# 姿勢判定で使う幾何計算をNumPyでまとめて行う関数群
+# keypoints は (..., 17, 3) の配列（先頭の次元は人数やフレーム数など任意）
+
+import numpy as np
+
+from components.keypoints import (
+    LEFT_SHOULDER, RIGHT_SHOULDER, LEFT_HIP, RIGHT_HIP,
+    LEFT_WRIST, RIGHT_WRIST
+)
+
+
+def point(keypoints, index):
+    # 指定したキーポイントの (x, y) を取り出す
+    return keypoints[..., index, :2]
+
+
+def midpoint(keypoints, index1, index2):
+    # 2つのキーポイントの中点を計算
+    return (keypoints[..., index1, :2] + keypoints[..., index2, :2]) / 2
+
+
+def vector(keypoints, start, end):
+    # start から end へのベクトルを計算
+    return keypoints[..., end, :2] - keypoints[..., start, :2]
+
+
+def shoulder_width(keypoints):
+    # 肩幅を計算（スケール調整のため）
+    return np.abs(keypoints[..., LEFT_SHOULDER, 0] - keypoints[..., RIGHT_SHOULDER, 0])
+
+
+def back_angle(shoulder_midpoint, hip_midpoint):
+    # 腰の中点から肩の中点への傾き（度）を計算
+    diff = shoulder_midpoint - hip_midpoint
+    return np.degrees(np.arctan2(diff[..., 1], diff[..., 0]))
+
+
+def is_back_straight(angle, tolerance_degrees=15):
+    # 背中の傾き angle がまっすぐかどうかを判定（許容範囲は±15度）
+    return np.abs(angle - 90) <= tolerance_degrees
+
+
+def angle_between(v1, v2):
+    # ベクトル間の角度（度）を計算
+    # 長さ0のベクトルを含む場合は NaN となり、以降の比較はすべて False になる
+    dot_product = np.sum(v1 * v2, axis=-1)
+    magnitudes = np.linalg.norm(v1, axis=-1) * np.linalg.norm(v2, axis=-1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cos_angle = dot_product / magnitudes
+    return np.degrees(np.arccos(np.clip(cos_angle, -1, 1)))
+
+
+def calculate_angle(point1, point2, point3):
+    # 3点間の角度を計算（点は (..., 2) の配列）
+    angle = np.degrees(np.arctan2(point3[..., 1] - point2[..., 1], point3[..., 0] - point2[..., 0]) -
+                       np.arctan2(point1[..., 1] - point2[..., 1], point1[..., 0] - point2[..., 0]))
+    return np.abs(angle)
+
+
+def distance(point1, point2):
+    # 2点間の距離を計算（点は (..., 2) の配列）
+    return np.linalg.norm(point1 - point2, axis=-1)
+
+
+def hands_on_hips(keypoints, width, tolerance=0.1):
+    # 両手が腰に当たっているかを確認（width は肩幅）
+    limit = tolerance * width
+    left_hand_on_hip = np.abs(keypoints[..., LEFT_WRIST, 1] - keypoints[..., LEFT_HIP, 1]) < limit
+    right_hand_on_hip = np.abs(keypoints[..., RIGHT_WRIST, 1] - keypoints[..., RIGHT_HIP, 1]) < limit
+    return left_hand_on_hip & right_hand_on_hip
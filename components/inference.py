@@ -0,0 +1,142 @@
+# 姿勢推定モデルの読み込みと推論バックエンドの選択
+# モデルは最初に使うとき（またはウォームアップのとき）に読み込む
+#
+# バックエンド
+#   torch:    PyTorch の重み（.pt）をそのまま使う
+#   onnx:     ONNX Runtime 用に書き出したモデル（.onnx）を使う
+#   openvino: OpenVINO 用に書き出したモデル（_openvino_model/）を使う
+# 書き出したモデルが無ければ最初の読み込み時に ultralytics の export で作る（入力サイズは可変）
+# 推論のスレッド数を指定できるのは torch だけ（ultralytics は ONNX Runtime と OpenVINO のスレッド数の設定を受け付けない）
+
+import os
+import threading
+import time
+import traceback
+
+import numpy as np
+
+BACKENDS = ('torch', 'onnx', 'openvino')
+
+# バックエンドごとの書き出したモデルのパスの接尾辞（ultralytics の export と同じ）
+EXPORT_SUFFIXES = {'onnx': '.onnx', 'openvino': '_openvino_model'}
+
+# スレッド数を設定できるバックエンド
+THREAD_BACKENDS = ('torch',)
+
+
+def configure_threads(threads):
+    # PyTorch の推論に使うスレッド数を設定する
+    try:
+        import torch
+        torch.set_num_threads(threads)
+    except ImportError:
+        pass
+
+
+class PoseModel:
+    # ultralytics の YOLO と同じように model(frames, **kwargs) で呼び出せる、遅延読み込みのモデル
+    def __init__(self, weights='yolov8n-pose.pt', backend='torch', imgsz=640, threads=None):
+        if backend not in BACKENDS:
+            raise ValueError(f'Unsupported backend: {backend} (choose from {", ".join(BACKENDS)})')
+        self.weights = weights
+        self.backend = backend
+        self.imgsz = imgsz  # 推論の入力サイズ（呼び出し時に imgsz を指定しなかった場合）
+        if threads and backend not in THREAD_BACKENDS:
+            # 設定できないスレッド数は使わず、/metrics にも設定したように表示しない
+            print(f"Warning: threads={threads} is not supported by the {backend} backend and is ignored "
+                  f"(supported: {', '.join(THREAD_BACKENDS)})")
+            threads = None
+        self.threads = threads
+        self.model = None
+        self.lock = threading.Lock()  # 読み込み中はこのロックを持ち続ける
+        self.warmup_lock = threading.Lock()  # ウォームアップのスレッドの開始用（読み込みを待たない）
+        self.warmup_thread = None
+        self.load_seconds = None
+        self.warmup_seconds = None
+        self.error = None  # 直近の読み込みまたはウォームアップの失敗
+
+    @classmethod
+    def from_env(cls):
+        # KOJI_MODEL, KOJI_BACKEND, KOJI_IMGSZ, KOJI_THREADS から設定する
+        threads = os.environ.get('KOJI_THREADS')
+        return cls(weights=os.environ.get('KOJI_MODEL', 'yolov8n-pose.pt'),
+                   backend=os.environ.get('KOJI_BACKEND', 'torch'),
+                   imgsz=int(os.environ.get('KOJI_IMGSZ', 640)),
+                   threads=int(threads) if threads else None)
+
+    def exported_path(self):
+        # バックエンド用に書き出したモデルのパス
+        if self.backend == 'torch' or self.weights.endswith(EXPORT_SUFFIXES[self.backend]):
+            return self.weights
+        return os.path.splitext(self.weights)[0] + EXPORT_SUFFIXES[self.backend]
+
+    def export(self):
+        # バックエンド用のモデルが無ければ書き出し、そのパスを返す
+        path = self.exported_path()
+        if path != self.weights and not os.path.exists(path):
+            from ultralytics import YOLO
+            print(f"Exporting {self.weights} for {self.backend}...")
+            path = YOLO(self.weights).export(format=self.backend, imgsz=self.imgsz, dynamic=True)
+        return path
+
+    def load(self):
+        # 最初の呼び出しでモデルを読み込む（複数のスレッドから呼ばれても1回だけ）
+        with self.lock:
+            if self.model is None:
+                from ultralytics import YOLO
+                start = time.perf_counter()
+                try:
+                    if self.threads:
+                        configure_threads(self.threads)
+                    self.model = YOLO(self.export(), task='pose')
+                except Exception as e:
+                    # 失敗を記録して呼び出し元に伝える（次の呼び出しで読み込みをやり直す）
+                    self.error = f'{type(e).__name__}: {e}'
+                    raise
+                self.load_seconds = time.perf_counter() - start
+                self.error = None
+            return self.model
+
+    def warmup(self, runs=2):
+        # 読み込みと最初の数回の推論（メモリ確保や最適化）を済ませておく
+        # 失敗してもスレッドを止めずに記録して表示する（to_dict の error で確認できる）
+        try:
+            model = self.load()
+            frame = np.zeros((self.imgsz, self.imgsz, 3), dtype=np.uint8)
+            start = time.perf_counter()
+            for _ in range(runs):
+                model(frame, imgsz=self.imgsz, verbose=False)
+        except Exception as e:
+            self.error = f'{type(e).__name__}: {e}'
+            print(f"Model warm-up failed ({self.backend}): {self.error}\n{traceback.format_exc()}")
+            # 次の warmup_async() でやり直せるようにする
+            with self.warmup_lock:
+                self.warmup_thread = None
+            return False
+        self.warmup_seconds = time.perf_counter() - start
+        print(f"Model ready ({self.backend}, load {self.load_seconds:.2f} s, warm-up {self.warmup_seconds:.2f} s)")
+        return True
+
+    def warmup_async(self):
+        # バックグラウンドでウォームアップを始める（すでに始めていれば何もしない）
+        # 読み込み中のロックは取らないので、読み込みに時間がかかってもすぐに戻る
+        with self.warmup_lock:
+            if self.warmup_thread is None:
+                self.warmup_thread = threading.Thread(target=self.warmup, name='warmup', daemon=True)
+                self.warmup_thread.start()
+
+    def __call__(self, frames, **kwargs):
+        kwargs.setdefault('imgsz', self.imgsz)
+        return self.load()(frames, **kwargs)
+
+    def to_dict(self):
+        return {
+            'weights': self.weights,
+            'backend': self.backend,
+            'imgsz': self.imgsz,
+            'threads': self.threads,
+            'loaded': self.model is not None,
+            'load_seconds': None if self.load_seconds is None else round(self.load_seconds, 3),
+            'warmup_seconds': None if self.warmup_seconds is None else round(self.warmup_seconds, 3),
+            'error': self.error,
+        }
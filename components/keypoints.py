@@ -0,0 +1,39 @@
+# YOLOv8-poseのキーポイント配列に関する定義
+
+import numpy as np
+
+# YOLOv8-poseのキーポイント名（出力順）
+KEYPOINT_NAMES = [
+    'nose', 'left_eye', 'right_eye', 'left_ear', 'right_ear',
+    'left_shoulder', 'right_shoulder', 'left_elbow', 'right_elbow',
+    'left_wrist', 'right_wrist', 'left_hip', 'right_hip',
+    'left_knee', 'right_knee', 'left_ankle', 'right_ankle'
+]
+
+# キーポイント名からインデックスへの対応（インポート時に一度だけ解決）
+KEYPOINT_INDEX = {name: i for i, name in enumerate(KEYPOINT_NAMES)}
+NOSE = KEYPOINT_INDEX['nose']
+LEFT_EYE = KEYPOINT_INDEX['left_eye']
+RIGHT_EYE = KEYPOINT_INDEX['right_eye']
+LEFT_EAR = KEYPOINT_INDEX['left_ear']
+RIGHT_EAR = KEYPOINT_INDEX['right_ear']
+LEFT_SHOULDER = KEYPOINT_INDEX['left_shoulder']
+RIGHT_SHOULDER = KEYPOINT_INDEX['right_shoulder']
+LEFT_ELBOW = KEYPOINT_INDEX['left_elbow']
+RIGHT_ELBOW = KEYPOINT_INDEX['right_elbow']
+LEFT_WRIST = KEYPOINT_INDEX['left_wrist']
+RIGHT_WRIST = KEYPOINT_INDEX['right_wrist']
+LEFT_HIP = KEYPOINT_INDEX['left_hip']
+RIGHT_HIP = KEYPOINT_INDEX['right_hip']
+LEFT_KNEE = KEYPOINT_INDEX['left_knee']
+RIGHT_KNEE = KEYPOINT_INDEX['right_knee']
+LEFT_ANKLE = KEYPOINT_INDEX['left_ankle']
+RIGHT_ANKLE = KEYPOINT_INDEX['right_ankle']
+
+
+def keypoints_to_array(keypoints_data):
+    # result.keypoints.data（(N, 17, 3) のテンソル）を float32 のNumPy配列として取得
+    # CPU上のテンソルであればコピーせずにビューを返す
+    if hasattr(keypoints_data, 'cpu'):
+        keypoints_data = keypoints_data.cpu().numpy()
+    return np.asarray(keypoints_data, dtype=np.float32)
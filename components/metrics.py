@@ -0,0 +1,127 @@
+# パイプラインの段ごとの処理時間・フレームレート・キューの状態を集計する
+
+import threading
+import time
+from collections import deque
+
+import cv2
+import numpy as np
+
+# Prometheus のヒストグラムのバケット（秒）
+HISTOGRAM_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+
+class StageHistogram:
+    # 直近 window 回分の処理時間（パーセンタイル用）と、起動からの累積ヒストグラムを持つ
+    def __init__(self, window):
+        self.recent = deque(maxlen=window)
+        self.bucket_counts = [0] * len(HISTOGRAM_BUCKETS)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, seconds):
+        self.recent.append(seconds)
+        self.count += 1
+        self.total += seconds
+        for i, bound in enumerate(HISTOGRAM_BUCKETS):
+            if seconds <= bound:
+                self.bucket_counts[i] += 1
+                break
+
+    def summary(self):
+        if not self.recent:
+            return {'count': self.count}
+        recent_ms = np.array(self.recent) * 1000
+        p50, p90, p99 = np.percentile(recent_ms, [50, 90, 99])
+        return {
+            'count': self.count,
+            'mean_ms': round(float(recent_ms.mean()), 2),
+            'p50_ms': round(float(p50), 2),
+            'p90_ms': round(float(p90), 2),
+            'p99_ms': round(float(p99), 2),
+        }
+
+
+class PipelineMetrics:
+    def __init__(self, window=300):
+        self.window = window
+        self.stages = {}  # 段の名前 -> StageHistogram
+        self.counters = {}
+        self.rates = {}  # 名前 -> 直近のイベント時刻（フレームレート計算用）
+        self.gauges = {}  # 名前 -> 値を返す関数
+        self.lock = threading.Lock()
+
+    def observe(self, stage, seconds):
+        with self.lock:
+            if stage not in self.stages:
+                self.stages[stage] = StageHistogram(self.window)
+            self.stages[stage].observe(seconds)
+
+    def increment(self, name, value=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def mark(self, name):
+        # イベントの発生を記録（毎秒の発生回数を計算する）
+        with self.lock:
+            if name not in self.rates:
+                self.rates[name] = deque(maxlen=self.window)
+            self.rates[name].append(time.time())
+
+    def gauge(self, name, fn):
+        self.gauges[name] = fn
+
+    def rate(self, name):
+        times = self.rates.get(name)
+        if not times or len(times) < 2 or times[-1] == times[0]:
+            return 0.0
+        if time.time() - times[-1] > 2.0:
+            return 0.0  # 止まっている
+        return (len(times) - 1) / (times[-1] - times[0])
+
+    def snapshot(self):
+        with self.lock:
+            stages = {name: histogram.summary() for name, histogram in self.stages.items()}
+            counters = dict(self.counters)
+            rates = {name: round(self.rate(name), 1) for name in self.rates}
+        return {
+            'stages': stages,
+            'counters': counters,
+            'fps': rates,
+            'gauges': {name: fn() for name, fn in self.gauges.items()},
+        }
+
+    def prometheus(self, prefix='koji'):
+        # Prometheus のテキスト形式で出力
+        lines = []
+        with self.lock:
+            lines.append(f'# TYPE {prefix}_stage_seconds histogram')
+            for name, histogram in self.stages.items():
+                cumulative = 0
+                for bound, count in zip(HISTOGRAM_BUCKETS, histogram.bucket_counts):
+                    cumulative += count
+                    lines.append(f'{prefix}_stage_seconds_bucket{{stage="{name}",le="{bound}"}} {cumulative}')
+                lines.append(f'{prefix}_stage_seconds_bucket{{stage="{name}",le="+Inf"}} {histogram.count}')
+                lines.append(f'{prefix}_stage_seconds_sum{{stage="{name}"}} {histogram.total:.6f}')
+                lines.append(f'{prefix}_stage_seconds_count{{stage="{name}"}} {histogram.count}')
+            for name, value in self.counters.items():
+                lines.append(f'# TYPE {prefix}_{name}_total counter')
+                lines.append(f'{prefix}_{name}_total {value}')
+            for name in self.rates:
+                lines.append(f'# TYPE {prefix}_{name}_fps gauge')
+                lines.append(f'{prefix}_{name}_fps {self.rate(name):.2f}')
+        for name, fn in self.gauges.items():
+            lines.append(f'# TYPE {prefix}_{name} gauge')
+            lines.append(f'{prefix}_{name} {fn()}')
+        return '\n'.join(lines) + '\n'
+
+    def draw_overlay(self, frame):
+        # フレームの左上に主要な指標を描画する
+        with self.lock:
+            lines = [f'{name} fps: {self.rate(name):.1f}' for name in self.rates]
+            for name, histogram in self.stages.items():
+                if histogram.recent:
+                    lines.append(f'{name}: {histogram.recent[-1] * 1000:.1f} ms')
+        for i, line in enumerate(lines):
+            cv2.putText(frame, line, (10, 20 + i * 18), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 255), 1, cv2.LINE_AA)
+        return frame
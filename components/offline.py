@@ -0,0 +1,160 @@
+# 録画済みの動画や画像フォルダに対して姿勢推定と判定をまとめて行う（カメラ・ブラウザ不要）
+
+import csv
+import os
+import time
+
+import cv2
+import numpy as np
+
+from components.filters import KeypointFilter
+from components.keypoints import keypoints_to_array
+from components.pose_estimations import PoseEstimator
+from components.pose_rules import POSE_RULES, compile_poses
+from components.recorder import SessionRecorder
+from components.renderer import draw_skeleton
+from components.tracking import KeypointTracker
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+# 判定結果として出力する姿勢
+VERDICT_POSES = list(POSE_RULES)
+
+
+def iter_frames(path, fps=30):
+    # 動画ファイルまたは画像フォルダから (フレーム番号, タイムスタンプ秒, フレーム) を順に返す
+    if os.path.isdir(path):
+        names = sorted(name for name in os.listdir(path) if name.lower().endswith(IMAGE_EXTENSIONS))
+        for index, name in enumerate(names):
+            frame = cv2.imread(os.path.join(path, name))
+            if frame is not None:
+                yield index, index / fps, frame
+        return
+
+    capture = cv2.VideoCapture(path)
+    video_fps = capture.get(cv2.CAP_PROP_FPS) or fps
+    index = 0
+    try:
+        while True:
+            success, frame = capture.read()
+            if not success:
+                break
+            yield index, index / video_fps, frame
+            index += 1
+    finally:
+        capture.release()
+
+
+def iter_batches(frames, batch_size):
+    batch = []
+    for item in frames:
+        batch.append(item)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def output_name(path):
+    return os.path.splitext(os.path.basename(os.path.normpath(path)))[0]
+
+
+def verdict_header():
+    # 判定結果CSVの列（フレーム単位の判定と時系列の判定）
+    return ['frame', 'timestamp', 'track_id'] + VERDICT_POSES + [f'{pose}_held' for pose in VERDICT_POSES]
+
+
+def verdict_row(index, timestamp, track_id, verdicts, held):
+    return ([index, f'{timestamp:.3f}', track_id] + [int(verdicts[pose]) for pose in VERDICT_POSES] +
+            [int(held[pose]) for pose in VERDICT_POSES])
+
+
+def process_source(model, path, output_dir, batch_size=16, fps=30, preview=False, smoothing=True, params=None):
+    # 1つの動画（または画像フォルダ）を処理し、キーポイントと姿勢ごとの判定を書き出す
+    # smoothing=True ならアプリと同じように人物ごとにキーポイントを平滑化してから判定する（記録は平滑化前）
+    # params は pose_rules.DEFAULT_PARAMS と同じキーで判定条件を上書きする
+    name = output_name(path)
+    recorder = SessionRecorder(os.path.join(output_dir, f'{name}_keypoints.npy'))
+    tracker = KeypointTracker()
+    keypoint_filter = KeypointFilter() if smoothing else None
+    evaluator = compile_poses(tuple(VERDICT_POSES))  # 一括判定用
+    estimators = {}  # track_id -> PoseEstimator（時系列の判定用）
+    writer = None
+    frames = 0
+    people = 0
+    start = time.time()
+
+    with open(os.path.join(output_dir, f'{name}_verdicts.csv'), 'w', newline='') as verdict_file:
+        verdicts_csv = csv.writer(verdict_file)
+        verdicts_csv.writerow(verdict_header())
+
+        for batch in iter_batches(iter_frames(path, fps), batch_size):
+            # フレームをまとめてモデルに渡す
+            results = model([frame for _, _, frame in batch], verbose=False)
+            keypoints = [keypoints_to_array(result.keypoints.data) for result in results]
+
+            # フレーム順に人物を追跡して平滑化する
+            track_ids = []
+            for i, (index, timestamp, _) in enumerate(batch):
+                track_ids.append(tracker.update(keypoints[i], timestamp))
+                if len(keypoints[i]):
+                    recorder.append(timestamp, track_ids[i], keypoints[i])
+                if keypoint_filter is not None:
+                    keypoints[i], _ = keypoint_filter.update(keypoints[i], track_ids[i], timestamp)
+
+            # バッチ内の全員分を一度に判定
+            counts = [len(k) for k in keypoints]
+            if sum(counts):
+                instant = evaluator.verdicts(evaluator.features(np.concatenate(keypoints), params))
+            offset = 0
+            for (index, timestamp, frame), frame_keypoints, frame_track_ids, count in zip(batch, keypoints, track_ids,
+                                                                                         counts):
+                for person, track_id in enumerate(frame_track_ids):
+                    verdicts = {pose: bool(instant[pose][offset + person]) for pose in VERDICT_POSES}
+                    if track_id not in estimators:
+                        estimators[track_id] = PoseEstimator()
+                    held = estimators[track_id].update_histories(verdicts, timestamp)
+                    verdicts_csv.writerow(verdict_row(index, timestamp, track_id, verdicts, held))
+                offset += count
+
+                # プレビューを指定した場合だけ描画して動画に書き出す
+                if preview:
+                    annotated_frame = frame
+                    for pose in frame_keypoints:
+                        draw_skeleton(annotated_frame, pose)
+                    if writer is None:
+                        height, width = annotated_frame.shape[:2]
+                        writer = cv2.VideoWriter(os.path.join(output_dir, f'{name}_preview.mp4'),
+                                                 cv2.VideoWriter_fourcc(*'mp4v'), fps, (width, height))
+                    writer.write(annotated_frame)
+
+            frames += len(batch)
+            people += sum(counts)
+
+    recorder.close()
+    if writer is not None:
+        writer.release()
+    elapsed = time.time() - start
+    return {'source': path, 'frames': frames, 'people': people, 'seconds': round(elapsed, 2),
+            'fps': round(frames / elapsed, 1) if elapsed else 0.0}
+
+
+# ここからプロセスプール用
+_worker_model = None
+
+
+def init_worker(model_path, backend='torch', threads=None):
+    # ワーカープロセスごとにモデルを用意する（記録の再採点だけならモデルは読み込まれない）
+    global _worker_model
+    from components.inference import PoseModel
+    _worker_model = PoseModel(model_path, backend, threads=threads)
+
+
+def process_in_worker(path, output_dir, batch_size, fps, preview, smoothing=True, params=None):
+    if path.endswith('.npy'):
+        # 記録したキーポイントは推論せずに採点し直す
+        from components.replay import rescore_to_csv
+        return rescore_to_csv(path, output_dir, params, smoothing)
+    return process_source(_worker_model, path, output_dir, batch_size, fps, preview, smoothing, params)
+# ここまでプロセスプール用
@@ -0,0 +1,431 @@
+# カメラ取得・推論・JPEGエンコードを別スレッドで並行処理するパイプライン
+
+import threading
+import time
+import traceback
+from collections import deque
+
+import cv2
+
+from components.keypoints import keypoints_to_array
+from components.metrics import PipelineMetrics
+from components.renderer import render_packet
+
+
+class LatestQueue:
+    # 有界のキュー。満杯のときは古い要素を捨てて最新の要素を残す
+    # on_drop を渡すと、要素を捨てるたびに呼ばれる
+    def __init__(self, maxsize=1, on_drop=None):
+        self.items = deque(maxlen=maxsize)
+        self.condition = threading.Condition()
+        self.dropped = 0
+        self.closed = False
+        self.on_drop = on_drop
+
+    def put(self, item):
+        with self.condition:
+            if len(self.items) == self.items.maxlen:
+                self.dropped += 1
+                if self.on_drop is not None:
+                    self.on_drop()
+            self.items.append(item)
+            self.condition.notify()
+
+    def get(self, timeout=None):
+        # 要素が届くまで待つ。閉じられた場合やタイムアウトした場合は None を返す
+        with self.condition:
+            self.condition.wait_for(lambda: self.items or self.closed, timeout)
+            if self.items:
+                return self.items.popleft()
+            return None
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+    def __len__(self):
+        return len(self.items)
+
+
+class FramePacket:
+    # パイプラインの各段を流れる1フレーム分のデータ
+    def __init__(self, frame, captured_at):
+        self.frame = frame
+        self.captured_at = captured_at  # カメラから取得した時刻（time.time()）
+        self.source_id = None  # 取得したカメラのID（複数のカメラを使う場合）
+        self.results = None
+        self.keypoints = None  # (N, 17, 3) のキーポイント配列（process_results で平滑化したもの）
+        self.raw_keypoints = None  # モデルが出力したままのキーポイント配列
+        self.velocities = None  # (N, 17, 2) の関節の速度（ピクセル/秒、平滑化しない場合は None）
+        self.track_ids = []  # キーポイントごとのトラックID
+        self.reused = False  # 推論を省略し、直前のキーポイントを使ったフレームか
+        self.verdicts = {}  # 姿勢名 -> 人物ごとのフレーム単位の判定（描画用）
+        self.scores = {}  # 姿勢名 -> 人物ごとの確からしさ（0〜1）
+        self.conditions = {}  # 姿勢の条件（特徴量名）-> 人物ごとのフレーム単位の判定（部位ごとの描画用）
+        self.active_poses = []  # 評価中の姿勢（描画する関節の選択用）
+        self.jpeg = None
+
+
+class Subscriber:
+    # 購読者（/video_feed や /events のクライアント）ごとのバッファ
+    # 受け取りが遅いクライアントでは古いフレームから捨てる
+    def __init__(self, buffer_size=2, metrics=None):
+        self.metrics = metrics
+        self.queue = LatestQueue(buffer_size, on_drop=metrics and (lambda: metrics.increment('dropped_frames_client')))
+        self.latency = 0.0  # 直近のカメラ取得から送出までの時間（秒）
+
+    def get(self):
+        # 次のフレームを取得（パイプラインが止まった場合は None）
+        return self.queue.get()
+
+    def mark_delivered(self, packet):
+        # クライアントへ送出した時点でのエンドツーエンドの遅延を記録
+        self.latency = time.time() - packet.captured_at
+        if self.metrics is not None:
+            self.metrics.observe('latency', self.latency)
+            self.metrics.mark('delivered')
+
+    @property
+    def dropped(self):
+        return self.queue.dropped
+
+
+class VideoPipeline:
+    # camera.read() → model(frame) → 骨格の描画と cv2.imencode をそれぞれ別スレッドで実行する
+    # 各段は最新フレーム優先のキューでつながっており、推論は常に最新のフレームに対して行われる
+    # 推論とエンコードはフレームごとに1回だけ行い、結果をすべての購読者に配信する
+    # process_results(packet) は推論結果ごとに推論スレッドで呼ばれる
+    # subscribe(results=True) の購読者には推論直後のパケットを全フレーム配信する（映像の購読者がいなければエンコードしない）
+    # 各段の処理時間・破棄したフレーム数・キューの長さは metrics に記録する（overlay=True でフレームにも描画）
+    # controller（AdaptiveController）を渡すと、遅延に応じて推論サイズ・推論間隔・JPEG品質・解像度を調整する
+    # inference（BatchInference）を渡すと、推論スレッドを持たずに複数のカメラでまとめて推論する
+    def __init__(self, camera, model, process_results, buffer_size=2, metrics=None, overlay=False, controller=None,
+                 results_buffer_size=30, inference=None):
+        self.camera = camera
+        self.model = model
+        self.inference = inference
+        self.process_results = process_results
+        self.buffer_size = buffer_size
+        self.results_buffer_size = results_buffer_size
+        self.metrics = metrics or PipelineMetrics()
+        self.overlay = overlay
+        self.controller = controller
+        self.subscribers = []  # 映像の購読者
+        self.result_subscribers = []  # 推論結果だけの購読者
+        self.lock = threading.Lock()  # 購読者リストの保護
+        self.lifecycle_lock = threading.Lock()  # 開始・停止の直列化
+        self.running = False
+        self.stop_event = threading.Event()
+        self.threads = []
+        self.last_packet = None  # 直前に推論したフレーム
+        self.frame_index = 0
+        self.capture_queue = self._queue('capture')
+        self.encode_queue = self._queue('encode')
+        self.metrics.gauge('capture_queue_depth', lambda: len(self.capture_queue))
+        self.metrics.gauge('encode_queue_depth', lambda: len(self.encode_queue))
+        self.metrics.gauge('subscribers', lambda: len(self.subscribers))
+        self.metrics.gauge('result_subscribers', lambda: len(self.result_subscribers))
+        if controller is not None:
+            self.metrics.gauge('adaptive_level', lambda: controller.level)
+
+    def _queue(self, name):
+        return LatestQueue(on_drop=lambda: self.metrics.increment(f'dropped_frames_{name}'))
+
+    def subscribe(self, results=False):
+        # 購読者を追加し、パイプラインが止まっていれば開始する
+        if results:
+            subscriber = Subscriber(self.results_buffer_size)
+        else:
+            subscriber = Subscriber(self.buffer_size, self.metrics)
+        with self.lifecycle_lock:
+            with self.lock:
+                (self.result_subscribers if results else self.subscribers).append(subscriber)
+                running = self.running
+            if not running:
+                self._start()
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        # 購読者を外し、誰もいなくなればパイプラインを止める
+        with self.lifecycle_lock:
+            with self.lock:
+                for subscribers in (self.subscribers, self.result_subscribers):
+                    if subscriber in subscribers:
+                        subscribers.remove(subscriber)
+                stop = self.running and not self.subscribers and not self.result_subscribers
+            if stop:
+                self.stop()
+
+    def _start(self):
+        # 前回のスレッドが残っていれば終了するまで待つ（カメラを同時に読んだり、前回の推論結果を配信したりしないため）
+        # camera.read() が止まっている場合も、読み込みが返って前回のスレッドが終了するまで新しいスレッドは開始しない
+        self._join(timeout=None)
+        self.running = True
+        self.stop_event = threading.Event()
+        self.last_packet = None
+        self.frame_index = 0
+        self.capture_queue = self._queue('capture')
+        self.encode_queue = self._queue('encode')
+        self.threads = [
+            threading.Thread(target=self._capture_loop, name='capture', daemon=True),
+            threading.Thread(target=self._encode_loop, name='encode', daemon=True),
+        ]
+        if self.inference is None:
+            self.threads.append(threading.Thread(target=self._inference_loop, name='inference', daemon=True))
+        else:
+            self.inference.attach(self)
+        for thread in self.threads:
+            thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        for queue in (self.capture_queue, self.encode_queue):
+            queue.close()
+        if self.inference is not None:
+            self.inference.detach(self)
+        self._join()
+
+    def _join(self, timeout=1.0):
+        for thread in self.threads:
+            if thread is not threading.current_thread():
+                thread.join(timeout=timeout)
+
+    def _publish(self, packet, results=False):
+        with self.lock:
+            subscribers = list(self.result_subscribers if results else self.subscribers)
+        for subscriber in subscribers:
+            subscriber.queue.put(packet)
+
+    def _has_video_subscribers(self):
+        with self.lock:
+            return bool(self.subscribers)
+
+    def _finish(self, stop_event):
+        # パイプラインの終了を購読者に知らせる
+        stop_event.set()
+        with self.lock:
+            if stop_event is not self.stop_event or not self.running:
+                return
+            self.running = False
+            subscribers = self.subscribers + self.result_subscribers
+            self.subscribers = []
+            self.result_subscribers = []
+        if self.inference is not None:
+            self.inference.detach(self)
+        for subscriber in subscribers:
+            subscriber.queue.close()
+
+    def _abort(self, stage, stop_event, queue):
+        # 段の処理で例外が起きたら次の段のキューを閉じてパイプラインを止める
+        # 購読者には終了を知らせるので、次の subscribe() で開始し直せる
+        print(f"Pipeline {stage} failed\n{traceback.format_exc()}")
+        if queue is not None:
+            queue.close()
+        self._finish(stop_event)
+
+    def _capture_loop(self):
+        stop_event, capture_queue, encode_queue, metrics = (self.stop_event, self.capture_queue, self.encode_queue,
+                                                             self.metrics)
+        try:
+            while not stop_event.is_set():
+                start = time.perf_counter()
+                success, frame = self.camera.read()
+                if not success:
+                    break
+                metrics.observe('capture', time.perf_counter() - start)
+                metrics.mark('captured')
+                capture_queue.put(FramePacket(frame, time.time()))
+                if self.inference is not None:
+                    self.inference.notify()
+        except Exception:
+            self._abort('capture', stop_event, capture_queue)
+        finally:
+            capture_queue.close()
+            if self.inference is not None:
+                # まとめて推論する場合は推論スレッドが無いので、ここでエンコードスレッドに終了を知らせる
+                encode_queue.close()
+                self.inference.notify()
+
+    def _inference_loop(self):
+        stop_event, capture_queue, encode_queue = self.stop_event, self.capture_queue, self.encode_queue
+        try:
+            while not stop_event.is_set():
+                packet = capture_queue.get()
+                if packet is None:
+                    break
+                if not self._reuse_inference(packet):
+                    # YOLOv8による推論を実行
+                    settings = self.controller.settings if self.controller is not None else None
+                    start = time.perf_counter()
+                    if settings is not None:
+                        results = self.model(packet.frame, imgsz=settings.imgsz)
+                    else:
+                        results = self.model(packet.frame)
+                    self._set_results(packet, results, time.perf_counter() - start)
+                self._finish_inference(packet, encode_queue)
+        except Exception:
+            self._abort('inference', stop_event, encode_queue)
+        finally:
+            encode_queue.close()
+
+    def _reuse_inference(self, packet):
+        # 推論間隔の設定で推論を省略するフレームなら、直前のキーポイントを使って True を返す
+        settings = self.controller.settings if self.controller is not None else None
+        frame_index = self.frame_index
+        self.frame_index += 1
+        if settings is None or self.last_packet is None or not frame_index % settings.stride:
+            return False
+        packet.results = self.last_packet.results
+        packet.keypoints = self.last_packet.keypoints
+        packet.raw_keypoints = self.last_packet.raw_keypoints
+        packet.velocities = self.last_packet.velocities
+        packet.reused = True
+        return True
+
+    def _set_results(self, packet, results, inference_seconds):
+        # 推論結果からキーポイント配列を取り出す
+        start = time.perf_counter()
+        packet.results = results
+        packet.keypoints = packet.raw_keypoints = keypoints_to_array(results[0].keypoints.data)
+        self.metrics.observe('inference', inference_seconds)
+        self.metrics.observe('keypoints', time.perf_counter() - start)
+        self.metrics.mark('inferred')
+        self.last_packet = packet
+
+    def _finish_inference(self, packet, encode_queue):
+        # 姿勢判定を行い、推論結果の購読者とエンコードスレッドに渡す
+        start = time.perf_counter()
+        self.process_results(packet)
+        self.metrics.observe('pose_evaluation', time.perf_counter() - start)
+        self._publish(packet, results=True)
+        if self._has_video_subscribers():
+            encode_queue.put(packet)
+
+    def _encode_loop(self):
+        stop_event, encode_queue, metrics = self.stop_event, self.encode_queue, self.metrics
+        try:
+            while not stop_event.is_set():
+                packet = encode_queue.get()
+                if packet is None:
+                    break
+                # 骨格をフレームに直接描画してJPEGにエンコード（推論を省略したフレームには直前のキーポイントを描画）
+                settings = self.controller.settings if self.controller is not None else None
+                start = time.perf_counter()
+                annotated_frame = render_packet(packet)
+                if settings is not None and settings.scale != 1.0:
+                    annotated_frame = cv2.resize(annotated_frame, None, fx=settings.scale, fy=settings.scale,
+                                                 interpolation=cv2.INTER_AREA)
+                if self.overlay:
+                    metrics.draw_overlay(annotated_frame)
+                encode_start = time.perf_counter()
+                if settings is not None:
+                    ret, buffer = cv2.imencode('.jpg', annotated_frame,
+                                           [cv2.IMWRITE_JPEG_QUALITY, settings.jpeg_quality])
+                else:
+                    ret, buffer = cv2.imencode('.jpg', annotated_frame)
+                packet.jpeg = buffer.tobytes()
+                metrics.observe('annotation', encode_start - start)
+                metrics.observe('encoding', time.perf_counter() - encode_start)
+                metrics.mark('encoded')
+                if self.controller is not None:
+                    self.controller.observe(time.time() - packet.captured_at)
+                self._publish(packet)
+        except Exception:
+            self._abort('encoding', stop_event, None)
+        finally:
+            self._finish(stop_event)
+
+
+class BatchInference:
+    # 複数の VideoPipeline（カメラごと）の最新フレームを集め、1回の model(frames) でまとめて推論するスレッド
+    # 結果はフレームごとに元のパイプラインに戻し、そのパイプラインの process_results とエンコードに渡す
+    # max_batch を超える数のカメラがある場合は max_batch 枚ずつに分けて推論する
+    def __init__(self, model, controller=None, max_batch=8):
+        self.model = model
+        self.controller = controller
+        self.max_batch = max_batch
+        self.pipelines = []  # 推論を受け持つ実行中のパイプライン
+        self.condition = threading.Condition()
+        self.thread = None
+        self.last_batch_size = 0  # 直近の推論でまとめたフレーム数
+
+    def attach(self, pipeline):
+        # パイプラインの開始時に呼ばれる（推論スレッドが止まっていれば開始する）
+        with self.condition:
+            if pipeline not in self.pipelines:
+                self.pipelines.append(pipeline)
+            if self.thread is None:
+                self._start_thread()
+            self.condition.notify_all()
+
+    def _start_thread(self):
+        # self.condition を持った状態で呼ぶ
+        self.thread = threading.Thread(target=self._loop, name='batch-inference', daemon=True)
+        self.thread.start()
+
+    def detach(self, pipeline):
+        # パイプラインの停止時に呼ばれる（どのパイプラインも無くなれば推論スレッドは終了する）
+        with self.condition:
+            if pipeline in self.pipelines:
+                self.pipelines.remove(pipeline)
+            self.condition.notify_all()
+
+    def notify(self):
+        # 新しいフレームが届いたことを推論スレッドに知らせる
+        with self.condition:
+            self.condition.notify_all()
+
+    def _ready(self):
+        return any(len(pipeline.capture_queue) for pipeline in self.pipelines)
+
+    def _loop(self):
+        pipelines = []
+        try:
+            while True:
+                with self.condition:
+                    self.condition.wait_for(lambda: not self.pipelines or self._ready())
+                    if not self.pipelines:
+                        return
+                    pipelines = [(pipeline, pipeline.stop_event, pipeline.encode_queue) for pipeline in self.pipelines]
+
+                # パイプラインごとに最新のフレームを1枚ずつ取り出す（推論を省略するフレームはその場で処理する）
+                batch = []
+                for pipeline, stop_event, encode_queue in pipelines:
+                    if stop_event.is_set():
+                        continue
+                    packet = pipeline.capture_queue.get(timeout=0)
+                    if packet is None:
+                        continue
+                    if pipeline._reuse_inference(packet):
+                        pipeline._finish_inference(packet, encode_queue)
+                    else:
+                        batch.append((pipeline, packet, encode_queue))
+
+                settings = self.controller.settings if self.controller is not None else None
+                for offset in range(0, len(batch), self.max_batch):
+                    chunk = batch[offset:offset + self.max_batch]
+                    frames = [packet.frame for _, packet, _ in chunk]
+                    start = time.perf_counter()
+                    if settings is not None:
+                        results = self.model(frames, imgsz=settings.imgsz)
+                    else:
+                        results = self.model(frames)
+                    inference_seconds = time.perf_counter() - start
+                    self.last_batch_size = len(chunk)
+                    for (pipeline, packet, encode_queue), result in zip(chunk, results):
+                        pipeline._set_results(packet, [result], inference_seconds)
+                        pipeline._finish_inference(packet, encode_queue)
+        except Exception:
+            # 推論や姿勢判定で例外が起きたら、このとき推論していたパイプラインをすべて止める
+            # （購読者には終了を知らせるので、次の subscribe() で開始し直せる）
+            print(f"Batch inference failed\n{traceback.format_exc()}")
+            for pipeline, stop_event, encode_queue in pipelines:
+                encode_queue.close()
+                pipeline._finish(stop_event)
+        finally:
+            with self.condition:
+                self.thread = None
+                # 終了する間に開始したパイプラインがあれば、新しいスレッドで推論を続ける
+                if self.pipelines:
+                    self._start_thread()
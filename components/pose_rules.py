@@ -0,0 +1,347 @@
+# 姿勢を「共通の幾何特徴量の組み合わせ」と「保持時間のルール」で宣言的に定義する
+# 姿勢を追加するときは register_pose() でルールを1つ追加する
+#
+# 特徴量は (..., 17, 3) のキーポイント配列からNumPyでまとめて計算し、
+# 複数の姿勢を同時に判定する場合でも1フレームにつき1回だけ計算する
+
+from functools import lru_cache
+
+import numpy as np
+
+from components import geometry
+from components.keypoints import (
+    KEYPOINT_INDEX, NOSE, LEFT_EYE, RIGHT_EYE, LEFT_SHOULDER, RIGHT_SHOULDER, LEFT_ELBOW, RIGHT_ELBOW,
+    LEFT_WRIST, RIGHT_WRIST, LEFT_HIP, RIGHT_HIP, LEFT_KNEE, RIGHT_KNEE, LEFT_ANKLE, RIGHT_ANKLE
+)
+from components.temporal import SlidingWindow
+
+# 判定のパラメーターの既定値
+DEFAULT_PARAMS = {
+    'tolerance': 0.1,  # 首の屈曲：鼻と肩の中点の高さの差（肩幅に対する割合）
+    'hip_tolerance': 0.1,  # 両手が腰に当たっているか：手首と腰の高さの差（肩幅に対する割合）
+    'threshold_angle': 15,  # 首の側屈・回旋・伸展の角度の許容範囲（度）
+    'back_tolerance': 15,  # 背中がまっすぐかの許容範囲（度）
+}
+
+
+# ここから特徴量
+class Feature:
+    def __init__(self, name, fn, dependencies, joints=()):
+        self.name = name
+        self.fn = fn  # fn(keypoints, params, *依存する特徴量の値)
+        self.dependencies = dependencies
+        # 条件として使う特徴量が調べる体の部位の関節（映像でこの部位を条件の判定結果の色で描く）
+        self.joints = [KEYPOINT_INDEX[joint] for joint in joints]
+
+
+FEATURES = {}
+
+
+def feature(*dependencies, joints=()):
+    # 特徴量を登録するデコレーター（関数名が特徴量名になる）
+    def register(fn):
+        FEATURES[fn.__name__] = Feature(fn.__name__, fn, dependencies, joints)
+        return fn
+    return register
+
+
+def _y(keypoints, index):
+    return keypoints[..., index, 1]
+
+
+@feature()
+def shoulder_midpoint(keypoints, params):
+    return geometry.midpoint(keypoints, LEFT_SHOULDER, RIGHT_SHOULDER)
+
+
+@feature()
+def hip_midpoint(keypoints, params):
+    return geometry.midpoint(keypoints, LEFT_HIP, RIGHT_HIP)
+
+
+@feature()
+def eyes_midpoint(keypoints, params):
+    return geometry.midpoint(keypoints, LEFT_EYE, RIGHT_EYE)
+
+
+@feature()
+def shoulder_width(keypoints, params):
+    return geometry.shoulder_width(keypoints)
+
+
+@feature('shoulder_midpoint', 'hip_midpoint')
+def back_angle(keypoints, params, shoulder_mid, hip_mid):
+    return geometry.back_angle(shoulder_mid, hip_mid)
+
+
+@feature('back_angle', joints=('left_shoulder', 'right_shoulder', 'left_hip', 'right_hip'))
+def back_straight(keypoints, params, angle):
+    return geometry.is_back_straight(angle, params['back_tolerance'])
+
+
+@feature('shoulder_width',
+         joints=('left_elbow', 'left_wrist', 'right_elbow', 'right_wrist', 'left_hip', 'right_hip'))
+def hands_on_hips(keypoints, params, width):
+    return geometry.hands_on_hips(keypoints, width, params['hip_tolerance'])
+
+
+@feature('eyes_midpoint')
+def head_vector(keypoints, params, eyes_mid):
+    # 両目の中点から鼻へのベクトル（顔の正中線）
+    return geometry.point(keypoints, NOSE) - eyes_mid
+
+
+@feature()
+def left_arm_vector(keypoints, params):
+    return geometry.vector(keypoints, LEFT_SHOULDER, LEFT_ELBOW)
+
+
+@feature()
+def right_arm_vector(keypoints, params):
+    return geometry.vector(keypoints, RIGHT_SHOULDER, RIGHT_ELBOW)
+
+
+@feature()
+def shoulder_vector(keypoints, params):
+    return geometry.vector(keypoints, LEFT_SHOULDER, RIGHT_SHOULDER)
+
+
+@feature('head_vector', 'left_arm_vector', 'right_arm_vector',
+         joints=('nose', 'left_eye', 'right_eye', 'left_shoulder', 'left_elbow', 'right_shoulder', 'right_elbow'))
+def head_tilted(keypoints, params, head, left_arm, right_arm):
+    # 顔の正中線がどちらかの上腕と平行に近い（首の側屈）
+    threshold = params['threshold_angle']
+    return ((geometry.angle_between(head, left_arm) <= threshold) |
+            (geometry.angle_between(head, right_arm) <= threshold))
+
+
+@feature('head_vector', 'shoulder_vector', joints=('nose', 'left_eye', 'right_eye', 'left_shoulder', 'right_shoulder'))
+def head_rotated(keypoints, params, head, shoulders):
+    # 顔の正中線と肩の向きがほぼ直角（首の回旋）
+    return np.abs(geometry.angle_between(head, shoulders) - 90) <= params['threshold_angle']
+
+
+@feature('shoulder_midpoint', 'shoulder_width', joints=('nose', 'left_shoulder', 'right_shoulder'))
+def neck_flexed(keypoints, params, shoulder_mid, width):
+    # 鼻が肩の中点の高さまで下がっている（首の屈曲）
+    return np.abs(_y(keypoints, NOSE) - shoulder_mid[..., 1]) <= params['tolerance'] * width
+
+
+@feature(joints=('right_shoulder', 'right_elbow', 'right_wrist'))
+def right_wrist_above_shoulder(keypoints, params):
+    return _y(keypoints, RIGHT_WRIST) < _y(keypoints, RIGHT_SHOULDER)
+
+
+@feature(joints=('left_elbow', 'left_knee', 'right_knee'))
+def sphinx_elbows(keypoints, params):
+    # スフィンクスのポーズ：肘と膝の角度がほぼ直角
+    angle = geometry.calculate_angle(geometry.point(keypoints, LEFT_ELBOW), geometry.point(keypoints, LEFT_KNEE),
+                                     geometry.point(keypoints, RIGHT_KNEE))
+    return (angle >= 85) & (angle <= 95)
+
+
+@feature(joints=('left_shoulder', 'left_hip', 'right_hip'))
+def back_horizontal(keypoints, params):
+    angle = geometry.calculate_angle(geometry.point(keypoints, LEFT_SHOULDER), geometry.point(keypoints, LEFT_HIP),
+                                     geometry.point(keypoints, RIGHT_HIP))
+    return np.abs(angle - 180) <= params['threshold_angle']
+
+
+@feature(joints=('nose', 'left_shoulder', 'right_shoulder'))
+def neck_extended(keypoints, params):
+    return _y(keypoints, NOSE) < np.minimum(_y(keypoints, LEFT_SHOULDER), _y(keypoints, RIGHT_SHOULDER))
+
+
+@feature()
+def body_length(keypoints, params):
+    # 体の長さを推定（肩から足首までの距離）
+    return np.maximum(
+        geometry.distance(geometry.point(keypoints, LEFT_SHOULDER), geometry.point(keypoints, LEFT_ANKLE)),
+        geometry.distance(geometry.point(keypoints, RIGHT_SHOULDER), geometry.point(keypoints, RIGHT_ANKLE)))
+
+
+@feature('body_length',
+         joints=('left_shoulder', 'left_elbow', 'left_wrist', 'right_shoulder', 'right_elbow', 'right_wrist'))
+def wrist_position_correct(keypoints, params, length):
+    # 手首が肩から「4足分」（体の長さの約2/3）の位置にあるか（10%の誤差を許容）
+    required_distance = length * 2 / 3
+    wrist_to_shoulder_distance = np.minimum(
+        geometry.distance(geometry.point(keypoints, LEFT_WRIST), geometry.point(keypoints, LEFT_SHOULDER)),
+        geometry.distance(geometry.point(keypoints, RIGHT_WRIST), geometry.point(keypoints, RIGHT_SHOULDER)))
+    return np.abs(wrist_to_shoulder_distance - required_distance) <= required_distance * 0.1
+
+
+@feature('body_length', joints=('nose', 'left_shoulder'))
+def head_reaches_mark(keypoints, params, length):
+    # 頭が「印」の高さ（体の長さの約1/3）まで上がっているか
+    return _y(keypoints, NOSE) <= _y(keypoints, LEFT_SHOULDER) - length / 3
+
+
+@feature('shoulder_width',
+         joints=('left_shoulder', 'left_elbow', 'left_wrist', 'right_shoulder', 'right_elbow', 'right_wrist'))
+def arms_level(keypoints, params, width):
+    # 肘と手首が肩の高さにある
+    limit = 0.25 * width
+    shoulder_y = (_y(keypoints, LEFT_SHOULDER) + _y(keypoints, RIGHT_SHOULDER)) / 2
+    level = np.ones(shoulder_y.shape, dtype=bool)
+    for index in (LEFT_ELBOW, RIGHT_ELBOW, LEFT_WRIST, RIGHT_WRIST):
+        level &= np.abs(_y(keypoints, index) - shoulder_y) < limit
+    return level
+
+
+@feature('shoulder_width',
+         joints=('left_shoulder', 'left_elbow', 'left_wrist', 'right_shoulder', 'right_elbow', 'right_wrist'))
+def arms_extended(keypoints, params, width):
+    # 両手首の間隔が肩幅の2.5倍以上
+    span = geometry.distance(geometry.point(keypoints, LEFT_WRIST), geometry.point(keypoints, RIGHT_WRIST))
+    return span >= 2.5 * width
+# ここまで特徴量
+
+
+# ここから姿勢のルール
+class Hold:
+    # 時系列の判定ルール
+    # 'held': seconds 秒間続けて条件を満たしたら完了
+    # 'majority': 直近 seconds 秒間のフレームの半分より多くで条件を満たしていれば完了
+    def __init__(self, kind, seconds):
+        self.kind = kind
+        self.seconds = seconds
+
+    def window(self):
+        return SlidingWindow(self.seconds)
+
+    def verdict(self, window):
+        if self.kind == 'majority':
+            return window.majority()
+        return window.held()
+
+    def progress(self, window):
+        # 完了までの進み具合（0〜1）
+        if self.kind == 'majority':
+            return 1.0 if window.majority() else window.true_ratio()
+        return window.progress()
+
+
+class PoseRule:
+    def __init__(self, name, label, joints, conditions, hold):
+        self.name = name
+        self.label = label  # 画面に表示する名前
+        self.joints = joints  # 判定に使う関節（映像に描画する関節）
+        self.joint_indices = [KEYPOINT_INDEX[joint] for joint in joints]
+        self.conditions = conditions  # すべて満たすと姿勢が取れているとみなす特徴量（ブール値）
+        self.hold = hold
+
+
+POSE_RULES = {}
+# ここまで姿勢のルール
+
+
+# ここから評価器
+class CompiledPoses:
+    # 指定した姿勢に必要な特徴量を依存関係の順に並べておき、1回の評価で各特徴量を1回だけ計算する
+    def __init__(self, poses, extra_features=()):
+        self.poses = list(poses)
+        self.rules = [POSE_RULES[pose] for pose in self.poses]
+        self.plan = []
+        planned = set()
+
+        def add(name):
+            if name in planned:
+                return
+            for dependency in FEATURES[name].dependencies:
+                add(dependency)
+            planned.add(name)
+            self.plan.append(FEATURES[name])
+
+        for rule in self.rules:
+            for condition in rule.conditions:
+                add(condition)
+        # 評価する姿勢の条件（重複なし）
+        self.conditions = list(dict.fromkeys(condition for rule in self.rules for condition in rule.conditions))
+        for name in extra_features:
+            add(name)
+
+    def features(self, keypoints, params=None):
+        # 特徴量をすべて計算して辞書で返す
+        keypoints = np.asarray(keypoints, dtype=np.float32)
+        params = DEFAULT_PARAMS if not params else {**DEFAULT_PARAMS, **params}
+        values = {}
+        for item in self.plan:
+            values[item.name] = item.fn(keypoints, params, *[values[name] for name in item.dependencies])
+        return values
+
+    def verdicts(self, features):
+        # 姿勢ごとのフレーム単位の判定（すべての条件を満たしているか）
+        return {rule.name: np.logical_and.reduce([features[name] for name in rule.conditions]) for rule in self.rules}
+
+    def scores(self, keypoints, features):
+        # 姿勢ごとの確からしさ（0〜1）：満たしている条件の割合 × 判定に使う関節の信頼度の平均
+        keypoints = np.asarray(keypoints, dtype=np.float32)
+        return {rule.name: (np.mean([features[name] for name in rule.conditions], axis=0) *
+                            keypoints[..., rule.joint_indices, 2].mean(axis=-1))
+                for rule in self.rules}
+
+    def evaluate(self, keypoints, params=None):
+        features = self.features(keypoints, params)
+        return self.verdicts(features), self.scores(keypoints, features)
+
+
+@lru_cache(maxsize=64)
+def compile_poses(poses=None, extra_features=()):
+    # 姿勢の組み合わせごとに評価器を1回だけ作る（poses を省略するとすべての姿勢）
+    return CompiledPoses(POSE_RULES if poses is None else poses, extra_features)
+# ここまで評価器
+
+
+# ここから姿勢の定義
+def register_pose(rule):
+    POSE_RULES[rule.name] = rule
+    compile_poses.cache_clear()
+    return rule
+
+
+register_pose(PoseRule(
+    'right_hand_raised', 'Right Hand Raised',
+    joints=['right_shoulder', 'right_elbow', 'right_wrist'],
+    conditions=['right_wrist_above_shoulder'],
+    hold=Hold('held', 2),
+))
+
+register_pose(PoseRule(
+    't_pose', 'T-Pose',
+    joints=['left_shoulder', 'right_shoulder', 'left_elbow', 'right_elbow', 'left_wrist', 'right_wrist'],
+    conditions=['arms_level', 'arms_extended'],
+    hold=Hold('held', 2),
+))
+
+register_pose(PoseRule(
+    'neck_flexion', 'Neck Flexion',
+    joints=['nose', 'left_shoulder', 'right_shoulder', 'left_hip', 'right_hip'],
+    conditions=['neck_flexed', 'back_straight'],
+    hold=Hold('majority', 5 / 30),  # 約5フレーム分の多数決
+))
+
+register_pose(PoseRule(
+    'lateral_flexion_neck', 'Lateral Flexion Neck',
+    joints=['nose', 'left_eye', 'right_eye', 'left_shoulder', 'right_shoulder', 'left_elbow', 'right_elbow',
+            'left_wrist', 'right_wrist', 'left_hip', 'right_hip'],
+    conditions=['head_tilted', 'back_straight', 'hands_on_hips'],
+    hold=Hold('held', 3),
+))
+
+register_pose(PoseRule(
+    'neck_rotation', 'Neck Rotation',
+    joints=['nose', 'left_eye', 'right_eye', 'left_shoulder', 'right_shoulder', 'left_wrist', 'right_wrist',
+            'left_hip', 'right_hip'],
+    conditions=['head_rotated', 'back_straight', 'hands_on_hips'],
+    hold=Hold('held', 3),
+))
+
+register_pose(PoseRule(
+    'neck_extension', '首の伸展',
+    joints=['nose', 'left_shoulder', 'right_shoulder', 'left_elbow', 'left_wrist', 'right_wrist',
+            'left_hip', 'right_hip', 'left_knee', 'right_knee', 'left_ankle', 'right_ankle'],
+    conditions=['sphinx_elbows', 'back_horizontal', 'neck_extended', 'wrist_position_correct', 'head_reaches_mark'],
+    hold=Hold('held', 3),
+))
+# ここまで姿勢の定義
@@ -0,0 +1,118 @@
+# セッション中のキーポイントを列指向のNPYファイルへ逐次記録する
+# 1行 = (timestamp, track_id, 17×(x, y, confidence)) の固定長レコード
+
+import struct
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from components.keypoints import KEYPOINT_NAMES
+
+RECORD_DTYPE = np.dtype([
+    ('timestamp', '<f8'),
+    ('track_id', '<i4'),
+    ('keypoints', '<f4', (len(KEYPOINT_NAMES), 3)),
+])
+
+# NPYヘッダーの長さを固定しておき、行数が増えても先頭のヘッダーだけを書き換えられるようにする
+HEADER_SIZE = 256
+
+
+class SessionRecorder:
+    # 事前に確保したチャンクに行を追加し、チャンクが埋まるたびにファイルへ書き出す
+    def __init__(self, path, chunk_size=512):
+        self.path = path
+        self.chunk = np.empty(chunk_size, dtype=RECORD_DTYPE)
+        self.count = 0  # チャンク内の行数
+        self.rows = 0  # ファイルに書き出した行数
+        self.file = open(path, 'wb')
+        self._write_header()
+
+    def append(self, timestamp, track_ids, keypoints):
+        # 1フレーム分（N人）のキーポイントを追加する
+        keypoints = np.asarray(keypoints, dtype=np.float32).reshape(-1, len(KEYPOINT_NAMES), 3)
+        start = 0
+        while start < len(keypoints):
+            size = min(len(keypoints) - start, len(self.chunk) - self.count)
+            rows = self.chunk[self.count:self.count + size]
+            rows['timestamp'] = timestamp
+            rows['track_id'] = track_ids[start:start + size]
+            rows['keypoints'] = keypoints[start:start + size]
+            self.count += size
+            start += size
+            if self.count == len(self.chunk):
+                self.flush()
+
+    def flush(self):
+        if self.count:
+            self.file.write(self.chunk[:self.count].tobytes())
+            self.rows += self.count
+            self.count = 0
+            self._write_header()
+            self.file.flush()
+
+    def close(self):
+        # 残りを書き出してファイルを閉じ、ファイルのパスを返す
+        if not self.file.closed:
+            self.flush()
+            self.file.close()
+        return self.path
+
+    def __len__(self):
+        return self.rows + self.count
+
+    def _write_header(self):
+        header = repr({
+            'descr': np.lib.format.dtype_to_descr(RECORD_DTYPE),
+            'fortran_order': False,
+            'shape': (self.rows,),
+        })
+        preamble = np.lib.format.magic(1, 0)
+        header_length = HEADER_SIZE - len(preamble) - 2
+        header = header.ljust(header_length - 1) + '\n'
+        self.file.seek(0)
+        self.file.write(preamble + struct.pack('<H', header_length) + header.encode('latin1'))
+        self.file.seek(0, 2)
+
+
+def load_recording(path):
+    # 記録したNPYファイルをメモリマップで読み込む
+    return np.load(path, mmap_mode='r')
+
+
+def recording_to_dataframe(records, min_confidence=0.5):
+    # 記録をExcel/CSV出力用のDataFrameに変換（信頼度が低い座標は空欄）
+    records = records[np.argsort(records['timestamp'], kind='stable')]
+    keypoints = np.asarray(records['keypoints'], dtype=np.float64)
+    confident = keypoints[:, :, 2] > min_confidence
+    columns = {
+        'timestamp': [datetime.fromtimestamp(t).strftime('%Y-%m-%d %H:%M:%S.%f') for t in records['timestamp'].tolist()],
+        'track_id': records['track_id'],
+    }
+    for i, name in enumerate(KEYPOINT_NAMES):
+        if not confident[:, i].any():
+            continue
+        columns[f'{name}_x'] = np.where(confident[:, i], np.round(keypoints[:, i, 0], 2), np.nan)
+        columns[f'{name}_y'] = np.where(confident[:, i], np.round(keypoints[:, i, 1], 2), np.nan)
+    df = pd.DataFrame(columns)
+    return df[['timestamp', 'track_id'] + sorted(col for col in df.columns if col not in ('timestamp', 'track_id'))]
+
+
+def export_recording(path, output_path, min_confidence=0.5, progress=None):
+    # 記録をXLSXまたはCSVとして書き出す（形式は拡張子で判断）。書き出した行数を返す
+    # progress が渡された場合は進捗（0〜1）を通知する
+    progress = progress or (lambda value: None)
+    records = load_recording(path)
+    progress(0.1)
+    if len(records) == 0:
+        progress(1.0)
+        return 0
+    df = recording_to_dataframe(records, min_confidence)
+    progress(0.4)
+    if output_path.endswith('.csv'):
+        df.to_csv(output_path, index=False)
+    else:
+        df.to_excel(output_path, index=False)
+    progress(1.0)
+    return len(df)
@@ -0,0 +1,90 @@
+# キーポイント配列から骨格をフレームに直接描画する（results[0].plot() のような画像のコピーは作らない）
+
+import cv2
+
+from components.keypoints import KEYPOINT_INDEX, KEYPOINT_NAMES
+from components.pose_estimations import pose_joints
+from components.pose_rules import FEATURES, compile_poses
+
+# 骨格の接続（YOLOv8-poseと同じ構成）
+SKELETON = [
+    ('left_ankle', 'left_knee'), ('left_knee', 'left_hip'), ('right_ankle', 'right_knee'), ('right_knee', 'right_hip'),
+    ('left_hip', 'right_hip'), ('left_shoulder', 'left_hip'), ('right_shoulder', 'right_hip'),
+    ('left_shoulder', 'right_shoulder'), ('left_shoulder', 'left_elbow'), ('right_shoulder', 'right_elbow'),
+    ('left_elbow', 'left_wrist'), ('right_elbow', 'right_wrist'), ('left_eye', 'right_eye'), ('nose', 'left_eye'),
+    ('nose', 'right_eye'), ('left_eye', 'left_ear'), ('right_eye', 'right_ear'), ('left_ear', 'left_shoulder'),
+    ('right_ear', 'right_shoulder'),
+]
+SKELETON_INDEX = [(KEYPOINT_INDEX[a], KEYPOINT_INDEX[b]) for a, b in SKELETON]
+
+# 色（BGR）
+NEUTRAL_COLOR = (255, 128, 0)
+PASS_COLOR = (0, 200, 0)
+FAIL_COLOR = (0, 0, 255)
+JOINT_COLOR = (0, 255, 255)
+
+
+def joints_for_poses(poses):
+    # 姿勢の一覧から描画する関節のインデックスを求める（指定が無ければ全関節）
+    names = set()
+    for pose in poses:
+        names.update(pose_joints.get(pose, []))
+    if not names:
+        names = set(KEYPOINT_NAMES)
+    return {KEYPOINT_INDEX[name] for name in names}
+
+
+def _status_color(status, neutral):
+    return neutral if status is None else (PASS_COLOR if status else FAIL_COLOR)
+
+
+def condition_parts(poses):
+    # 評価中の姿勢の条件ごとに、条件が調べる関節とその関節どうしの骨格の接続（SKELETON_INDEX の番号）を求める
+    parts = []
+    for name in compile_poses(tuple(poses)).conditions:
+        joints = set(FEATURES[name].joints)
+        limbs = {limb for limb, (start, end) in enumerate(SKELETON_INDEX) if start in joints and end in joints}
+        parts.append((name, joints, limbs))
+    return parts
+
+
+def draw_skeleton(frame, keypoints, joints=None, status=None, min_confidence=0.5, thickness=2, radius=4,
+                  limb_status=None, joint_status=None):
+    # 1人分の (17, 3) のキーポイントを frame に直接描画する
+    # status が True/False なら判定に合わせて骨格を緑/赤で描く
+    # limb_status（骨格の接続の番号 -> 判定）と joint_status（関節 -> 判定）を渡すと、その部位だけ判定の色で描く
+    if joints is None:
+        joints = range(len(KEYPOINT_NAMES))
+    color = _status_color(status, NEUTRAL_COLOR)
+    limb_status = limb_status or {}
+    joint_status = joint_status or {}
+    points = keypoints.tolist()
+    visible = {i for i in joints if points[i][2] > min_confidence}
+    for limb, (start, end) in enumerate(SKELETON_INDEX):
+        if start in visible and end in visible:
+            limb_color = _status_color(limb_status[limb], color) if limb in limb_status else color
+            cv2.line(frame, (int(points[start][0]), int(points[start][1])),
+                     (int(points[end][0]), int(points[end][1])), limb_color, thickness, cv2.LINE_AA)
+    for i in visible:
+        cv2.circle(frame, (int(points[i][0]), int(points[i][1])), radius,
+                   _status_color(joint_status.get(i), JOINT_COLOR), -1, cv2.LINE_AA)
+    return frame
+
+
+def render_packet(packet):
+    # パイプラインのフレームに、評価中の姿勢に関係する関節だけを描画する
+    # 姿勢の条件ごとに、その条件が調べる部位（関節と骨格の接続）を条件の判定結果の色で描く
+    # 同じ部位を調べる条件が複数あれば、1つでも満たしていなければ赤。どの条件も調べない部位は既定の色
+    joints = joints_for_poses(packet.active_poses)
+    parts = [part for part in condition_parts(packet.active_poses) if part[0] in packet.conditions]
+    for person, keypoints in enumerate(packet.keypoints):
+        limb_status = {}
+        joint_status = {}
+        for name, part_joints, limbs in parts:
+            passed = bool(packet.conditions[name][person])
+            for limb in limbs:
+                limb_status[limb] = limb_status.get(limb, True) and passed
+            for joint in part_joints:
+                joint_status[joint] = joint_status.get(joint, True) and passed
+        draw_skeleton(packet.frame, keypoints, joints, limb_status=limb_status, joint_status=joint_status)
+    return packet.frame
@@ -0,0 +1,113 @@
+# 記録したキーポイント（NPY）を推論なしで再生し、判定条件を変えて採点し直す
+# ライブと同じ順序（人物ごとの平滑化 → フレーム単位の判定 → 時系列の判定）で処理するので、
+# 同じ条件ならライブと同じ判定になる（推論を省略したフレームは記録されないので、その分だけ履歴が少ない）
+
+import csv
+import os
+import time
+
+import numpy as np
+
+from components.filters import KeypointFilter
+from components.offline import VERDICT_POSES, output_name, verdict_header, verdict_row
+from components.pipeline import FramePacket
+from components.pose_estimations import PoseEstimator
+from components.pose_rules import compile_poses
+from components.recorder import load_recording
+
+
+def iter_recording(records):
+    # 記録をフレーム（同じタイムスタンプの行）ごとに (timestamp, track_ids, keypoints) として返す
+    if len(records) == 0:
+        return
+    timestamps = records['timestamp']
+    if np.any(np.diff(timestamps) < 0):
+        records = records[np.argsort(timestamps, kind='stable')]
+        timestamps = records['timestamp']
+    bounds = np.flatnonzero(np.diff(timestamps)) + 1
+    for start, end in zip(np.concatenate([[0], bounds]), np.concatenate([bounds, [len(records)]])):
+        yield float(timestamps[start]), records['track_id'][start:end].tolist(), np.asarray(records['keypoints'][start:end])
+
+
+def replay(path, poses=None, params=None, smoothing=True, realtime=False, speed=1.0):
+    # 記録を再生し、フレームごとに (packet, held) を返す
+    # packet は FramePacket（keypoints, raw_keypoints, track_ids, verdicts, scores を設定済み）、
+    # held は人物ごとの {姿勢名: 時系列の判定} のリスト
+    # params は pose_rules.DEFAULT_PARAMS と同じキーで判定条件を上書きする
+    # realtime=True なら記録時の間隔（speed 倍速）で返す。False ならできるだけ速く返す
+    frames = list(iter_recording(load_recording(path)))
+    if not frames:
+        return
+    evaluator = compile_poses(None if poses is None else tuple(poses))
+    keypoint_filter = KeypointFilter() if smoothing else None
+
+    # 平滑化はフレーム順に行い、フレーム単位の判定は全フレーム分を一度に行う
+    packets = []
+    for timestamp, track_ids, keypoints in frames:
+        packet = FramePacket(None, timestamp)
+        packet.track_ids = track_ids
+        packet.keypoints = packet.raw_keypoints = keypoints
+        if keypoint_filter is not None:
+            packet.keypoints, packet.velocities = keypoint_filter.update(keypoints, track_ids, timestamp)
+        packet.active_poses = evaluator.poses
+        packets.append(packet)
+    verdicts, scores = evaluator.evaluate(np.concatenate([packet.keypoints for packet in packets]), params)
+
+    estimators = {}  # track_id -> PoseEstimator
+    offset = 0
+    clock_start = time.time()
+    first_timestamp = packets[0].captured_at
+    for packet in packets:
+        count = len(packet.track_ids)
+        packet.verdicts = {pose: values[offset:offset + count] for pose, values in verdicts.items()}
+        packet.scores = {pose: values[offset:offset + count] for pose, values in scores.items()}
+        offset += count
+
+        held = []
+        for person, track_id in enumerate(packet.track_ids):
+            if track_id not in estimators:
+                estimators[track_id] = PoseEstimator()
+            held.append({pose: estimators[track_id].update(pose, packet.verdicts[pose][person], packet.captured_at)
+                         for pose in evaluator.poses})
+
+        if realtime:
+            delay = (packet.captured_at - first_timestamp) / speed - (time.time() - clock_start)
+            if delay > 0:
+                time.sleep(delay)
+        yield packet, held
+
+
+def rescore(path, poses=None, params=None, smoothing=True):
+    # 記録を採点し直し、姿勢ごと・人物ごとに最初に完了した時刻（記録の開始からの秒数）をまとめて返す
+    frames = 0
+    first_timestamp = None
+    completed = {}  # 姿勢名 -> {track_id: 秒}
+    for packet, held in replay(path, poses, params, smoothing):
+        if first_timestamp is None:
+            first_timestamp = packet.captured_at
+        frames += 1
+        for track_id, person_held in zip(packet.track_ids, held):
+            for pose, detected in person_held.items():
+                if detected and track_id not in completed.setdefault(pose, {}):
+                    completed[pose][track_id] = round(packet.captured_at - first_timestamp, 3)
+    return {'source': path, 'frames': frames, 'completed': completed}
+
+
+def rescore_to_csv(path, output_dir, params=None, smoothing=True):
+    # offline.process_source と同じ形式の判定結果CSV（<名前>_verdicts.csv）を書き出す
+    name = output_name(path)
+    frames = 0
+    people = 0
+    start = time.time()
+    with open(os.path.join(output_dir, f'{name}_verdicts.csv'), 'w', newline='') as verdict_file:
+        verdicts_csv = csv.writer(verdict_file)
+        verdicts_csv.writerow(verdict_header())
+        for index, (packet, held) in enumerate(replay(path, VERDICT_POSES, params, smoothing)):
+            for person, track_id in enumerate(packet.track_ids):
+                verdicts = {pose: bool(packet.verdicts[pose][person]) for pose in VERDICT_POSES}
+                verdicts_csv.writerow(verdict_row(index, packet.captured_at, track_id, verdicts, held[person]))
+            frames += 1
+            people += len(packet.track_ids)
+    elapsed = time.time() - start
+    return {'source': path, 'frames': frames, 'people': people, 'seconds': round(elapsed, 2),
+            'fps': round(frames / elapsed, 1) if elapsed else 0.0}
@@ -0,0 +1,197 @@
+# ブラウザごとの評価セッションと、人物ごとの姿勢推定の状態を管理する
+
+import os
+import threading
+import time
+import uuid
+from datetime import datetime
+
+import numpy as np
+
+from components.pose_estimations import ALL_POSES, PoseEstimator, available_poses
+from components.pose_rules import compile_poses
+from components.recorder import SessionRecorder
+
+
+class PoseSession:
+    # 1つの評価セッション。追跡中の人物ごとに PoseEstimator を持つ
+    def __init__(self, session_id, record_dir, selected_pose='right_hand_raised', track_timeout=5.0):
+        self.session_id = session_id
+        self.record_dir = record_dir
+        self.selected_pose = selected_pose
+        self.track_timeout = track_timeout  # この秒数見えなかった人物の状態を破棄する
+        self.estimators = {}  # track_id -> PoseEstimator
+        self.last_seen = {}  # track_id -> 最後に検出された時刻
+        self.recorder = None  # キーポイントの記録（最初のフレームで開始）
+        self.recordings = 0  # このセッションで開始した記録の数（ファイル名を重複させないため）
+        self.streams = 0  # 映像を受信中のクライアント数
+        self.source_id = None  # 受信中のカメラのID
+        self.completed = False
+        self.completed_poses = {}  # すべての姿勢を評価するモードで完了した姿勢 -> 完了した時刻
+        self.status = {}  # track_id -> 姿勢名 -> 直近のフレームの確からしさ・進み具合
+        self.status_time = None
+        self.last_access = time.time()
+        self.lock = threading.Lock()
+
+    def estimator(self, track_id):
+        if track_id not in self.estimators:
+            self.estimators[track_id] = PoseEstimator()
+        return self.estimators[track_id]
+
+    def poses(self):
+        # このセッションで評価する姿勢
+        return list(available_poses) if self.selected_pose == ALL_POSES else [self.selected_pose]
+
+    def set_pose(self, pose):
+        # 姿勢を切り替えたら判定の履歴もやり直す
+        with self.lock:
+            self.selected_pose = pose
+            for pose_estimator in self.estimators.values():
+                pose_estimator.reset()
+            self.completed = False
+            self.completed_poses = {}
+            self.status = {}
+
+    def open_stream(self, source_id=None):
+        with self.lock:
+            self.streams += 1
+            self.source_id = source_id
+            self.completed = False
+
+    def close_stream(self):
+        with self.lock:
+            self.streams -= 1
+
+    def process(self, packet):
+        # 推論結果を人物ごとの PoseEstimator に渡し、姿勢が完了したら True を返す
+        with self.lock:
+            if not self.streams or self.completed or packet.source_id != self.source_id:
+                return False
+            current_time = packet.captured_at
+            stop_recording = False
+            poses = self.poses()
+            verdicts, scores = packet.verdicts, packet.scores
+            if len(packet.keypoints) and any(pose not in scores for pose in poses):
+                # 推論スレッドでの判定の後に姿勢が切り替えられた場合はここで判定する
+                verdicts, scores = compile_poses(tuple(poses)).evaluate(packet.keypoints)
+
+            self.status = {}
+            for person, track_id in enumerate(packet.track_ids):
+                self.last_seen[track_id] = current_time
+                pose_estimator = self.estimator(track_id)
+
+                # 評価する姿勢ごとにフレーム単位の判定を時系列の履歴に渡す（判定は全員分まとめて計算済み）
+                states = {}
+                for pose in poses:
+                    detected = pose_estimator.update(pose, verdicts[pose][person], current_time)
+                    states[pose] = {
+                        'confidence': round(float(scores[pose][person]), 3),
+                        'progress': round(pose_estimator.progress(pose), 3),
+                        'detected': detected,
+                    }
+                    if detected and self.selected_pose == ALL_POSES:
+                        # すべての姿勢を評価するモードでは映像を止めずに完了した姿勢を記録する
+                        if pose not in self.completed_poses:
+                            print(f"[{self.session_id}] Detected {available_poses[pose]}.")
+                            self.completed_poses[pose] = current_time
+                    else:
+                        stop_recording = stop_recording or detected
+                self.status[track_id] = states
+            self.status_time = current_time
+
+            # 見えなくなった人物の状態を破棄
+            for track_id in [t for t, seen in self.last_seen.items() if current_time - seen > self.track_timeout]:
+                del self.last_seen[track_id]
+                del self.estimators[track_id]
+
+            # セッションデータに追加（推論を省略したフレームは同じキーポイントなので記録しない）
+            # 姿勢が完了したフレームも記録する（再生したときに同じフレームで完了するように）
+            # 記録するのは平滑化する前のキーポイント
+            if len(packet.keypoints) and not packet.reused:
+                if self.recorder is None:
+                    self.recorder = SessionRecorder(self._recording_path())
+                self.recorder.append(current_time, packet.track_ids, packet.raw_keypoints)
+
+            if stop_recording:
+                print(f"[{self.session_id}] Detected {available_poses[self.selected_pose]}. Stopping video.")
+                self.completed = True
+                return True
+            return False
+
+    def _recording_path(self):
+        # 保存した直後に同じ秒のうちに次の記録が始まっても、保存済みのファイル（書き出し中の場合もある）を上書きしない
+        self.recordings += 1
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        return os.path.join(self.record_dir,
+                            f'keypoints_data_{timestamp}_{self.session_id[:8]}_{self.recordings}.npy')
+
+    def finish_recording(self):
+        # 記録を閉じてNPYファイルのパスを返す（記録が無ければ None）。次のフレームからは新しい記録になる
+        with self.lock:
+            recorder = self.recorder
+            self.recorder = None
+        if recorder is None:
+            return None
+        return recorder.close()
+
+    def frame_event(self, packet):
+        # /events で送る1フレーム分の結果（キーポイントは [x, y, 信頼度] × 17 を平坦にした配列）
+        # 姿勢の状況はこのセッションの最新の判定（通常は同じフレームの判定）
+        with self.lock:
+            return {
+                'timestamp': round(packet.captured_at, 3),
+                'completed': self.completed,
+                'completed_poses': list(self.completed_poses),
+                'people': [{'track_id': track_id,
+                            'keypoints': np.round(keypoints.astype(np.float64), 2).ravel().tolist(),
+                            'poses': self.status.get(track_id, {})}
+                           for track_id, keypoints in zip(packet.track_ids, packet.keypoints)],
+            }
+
+    def status_dict(self):
+        # /pose_status で返す評価の状況
+        with self.lock:
+            return {
+                'pose': self.selected_pose,
+                'completed': self.completed,
+                'completed_poses': [{'pose': pose, 'label': available_poses[pose], 'timestamp': completed_at}
+                                    for pose, completed_at in self.completed_poses.items()],
+                'timestamp': self.status_time,
+                'people': [{'track_id': track_id, 'poses': states} for track_id, states in self.status.items()],
+            }
+
+
+class SessionManager:
+    # セッションIDをキーにして PoseSession を管理する
+    def __init__(self, record_dir, idle_timeout=3600):
+        self.record_dir = record_dir  # キーポイントの記録を保存するディレクトリ
+        self.idle_timeout = idle_timeout  # この秒数アクセスの無いセッションは破棄する
+        self.sessions = {}
+        self.lock = threading.Lock()
+
+    def new_id(self):
+        return uuid.uuid4().hex
+
+    def get(self, session_id):
+        now = time.time()
+        with self.lock:
+            for stale_id in [sid for sid, s in self.sessions.items()
+                             if not s.streams and now - s.last_access > self.idle_timeout]:
+                self.sessions.pop(stale_id).finish_recording()
+            session = self.sessions.get(session_id)
+            if session is None:
+                session = self.sessions[session_id] = PoseSession(session_id, self.record_dir)
+            session.last_access = now
+            return session
+
+    def active_poses(self, source_id=None):
+        # カメラ source_id の映像を受信中のセッションで評価している姿勢
+        with self.lock:
+            return sorted({pose for s in self.sessions.values() if s.streams and s.source_id == source_id
+                           for pose in s.poses()})
+
+    def process(self, packet):
+        # 同じカメラの映像を受信中のすべてのセッションで姿勢判定を行い、完了したセッションIDを返す
+        with self.lock:
+            sessions = list(self.sessions.values())
+        return {session.session_id for session in sessions if session.process(packet)}
@@ -0,0 +1,69 @@
+# 複数のカメラ（カメラ番号、RTSPなどのストリームのURL、動画ファイル）を同時に扱う
+# カメラごとに取得スレッド・トラッカー・平滑化フィルター・パイプラインを持ち、推論は BatchInference でまとめて行う
+#
+# KOJI_SOURCES の書式（カンマ区切り）
+#   0,1                              カメラ番号 0 と 1（IDは "0" と "1"）
+#   front=0,door=rtsp://host/stream  ID=ソース（IDは英数字と _ のみ）
+#   video.mp4                        IDを省略すると先頭からの番号になる
+
+import re
+
+from components.camera import LazyCamera
+from components.filters import KeypointFilter
+from components.metrics import PipelineMetrics
+from components.pipeline import VideoPipeline
+from components.pose_estimations import PoseEstimator
+from components.tracking import KeypointTracker
+
+_NAMED_SOURCE = re.compile(r'^(\w+)=(.+)$')
+
+
+def parse_sources(value):
+    # KOJI_SOURCES の文字列を (ID, ソース) のリストにする（数字だけのソースはカメラ番号）
+    sources = []
+    for index, item in enumerate(part.strip() for part in value.split(',') if part.strip()):
+        match = _NAMED_SOURCE.match(item)
+        source_id, source = match.groups() if match else (str(index), item)
+        if any(source_id == existing for existing, _ in sources):
+            raise ValueError(f'Duplicate source id: {source_id}')
+        sources.append((source_id, int(source) if source.isdigit() else source))
+    if not sources:
+        raise ValueError('No video sources configured.')
+    return sources
+
+
+class VideoSource:
+    # 1台のカメラ。人物の追跡・平滑化・描画用の判定はカメラごとに行い、姿勢の評価は同じカメラを見ているセッションに渡す
+    def __init__(self, source_id, source, model, session_manager, fps=30, smoothing=True, overlay=False,
+                 controller=None, inference=None):
+        self.source_id = source_id
+        self.source = source
+        self.session_manager = session_manager
+        self.camera = LazyCamera(source, fps)
+        self.tracker = KeypointTracker()
+        self.keypoint_filter = KeypointFilter() if smoothing else None
+        self.batch_estimator = PoseEstimator()
+        self.metrics = PipelineMetrics()
+        self.metrics.gauge('target_fps', lambda: fps)
+        if inference is not None:
+            self.metrics.gauge('inference_batch_size', lambda: inference.last_batch_size)
+        self.pipeline = VideoPipeline(self.camera, model, self.process_results, metrics=self.metrics,
+                                      overlay=overlay, controller=controller, inference=inference)
+
+    def process_results(self, packet):
+        # 推論結果ごとに呼ばれ、人物の追跡と各セッションの姿勢判定を行う（フレームごとに1回だけ実行）
+        packet.source_id = self.source_id
+        packet.track_ids = self.tracker.update(packet.raw_keypoints, packet.captured_at)
+        if self.keypoint_filter is not None and not packet.reused:
+            # 追跡した人物ごとに平滑化（推論を省略したフレームは直前の平滑化の結果をそのまま使う）
+            packet.keypoints, packet.velocities = self.keypoint_filter.update(packet.raw_keypoints, packet.track_ids,
+                                                                              packet.captured_at)
+        packet.active_poses = self.session_manager.active_poses(self.source_id)
+        if len(packet.keypoints):
+            # 評価中の姿勢だけをまとめて判定（共通の特徴量は1回だけ計算される）
+            packet.verdicts, packet.scores, packet.conditions = self.batch_estimator.score_conditions(
+                packet.keypoints, poses=packet.active_poses)
+        self.session_manager.process(packet)
+
+    def to_dict(self):
+        return {'id': self.source_id, 'source': str(self.source), 'running': self.pipeline.running}
@@ -0,0 +1,69 @@
+# フレームごとの判定結果を時間窓で評価する部品
+# 窓の長さはフレーム数ではなく秒で指定し、フレームのタイムスタンプで管理する
+
+from collections import deque
+
+
+class SlidingWindow:
+    # 直近 duration 秒間の判定結果を保持し、多数決と継続時間の判定をフレームごとに O(1) で行う
+    def __init__(self, duration):
+        self.duration = duration
+        self.entries = deque()  # (timestamp, value)
+        self.true_count = 0  # 窓内の True の数
+        self.true_since = None  # 最後に False になった後、最初に True になった時刻
+        self.last_timestamp = None
+        self.last_value = False
+
+    def push(self, timestamp, value):
+        value = bool(value)
+        self.entries.append((timestamp, value))
+        self.true_count += value
+        if value and not self.last_value:
+            self.true_since = timestamp
+        elif not value:
+            self.true_since = None
+        self.last_timestamp = timestamp
+        self.last_value = value
+
+        # 窓から外れた古い結果を取り除く
+        limit = timestamp - self.duration
+        while self.entries and self.entries[0][0] < limit:
+            old_timestamp, old_value = self.entries.popleft()
+            self.true_count -= old_value
+        return value
+
+    def majority(self):
+        # 窓内の半分より多くのフレームで True か
+        return self.true_count > len(self.entries) / 2
+
+    def held_duration(self):
+        # True が途切れずに続いている時間（秒）
+        if self.true_since is None:
+            return 0.0
+        return self.last_timestamp - self.true_since
+
+    def held(self):
+        # duration 秒間 True が続いているか
+        return self.true_since is not None and self.held_duration() >= self.duration
+
+    def true_ratio(self):
+        # 窓内で True だったフレームの割合
+        return self.true_count / len(self.entries) if self.entries else 0.0
+
+    def progress(self):
+        # held() の判定までの進み具合（0〜1）
+        if self.true_since is None:
+            return 0.0
+        if self.duration <= 0:
+            return 1.0
+        return min(self.held_duration() / self.duration, 1.0)
+
+    def reset(self):
+        self.entries.clear()
+        self.true_count = 0
+        self.true_since = None
+        self.last_timestamp = None
+        self.last_value = False
+
+    def __len__(self):
+        return len(self.entries)
@@ -0,0 +1,86 @@
+# フレーム間で同一人物を対応付ける軽量トラッカー
+# キーポイントの外接矩形のIoUで貪欲にマッチングする
+
+import numpy as np
+
+
+def keypoint_boxes(keypoints, min_confidence=0.5):
+    # (N, 17, 3) のキーポイントから外接矩形 (N, 4) = (x1, y1, x2, y2) を計算
+    # 信頼度の高いキーポイントが無い人物はすべてのキーポイントを使う
+    xy = keypoints[..., :2]
+    confident = keypoints[..., 2] > min_confidence
+    confident[~confident.any(axis=-1)] = True
+    x = xy[..., 0]
+    y = xy[..., 1]
+    return np.stack([
+        np.where(confident, x, np.inf).min(axis=-1),
+        np.where(confident, y, np.inf).min(axis=-1),
+        np.where(confident, x, -np.inf).max(axis=-1),
+        np.where(confident, y, -np.inf).max(axis=-1),
+    ], axis=-1)
+
+
+def box_iou(boxes1, boxes2):
+    # (A, 4) と (B, 4) の矩形の IoU 行列 (A, B) を計算
+    x1 = np.maximum(boxes1[:, None, 0], boxes2[None, :, 0])
+    y1 = np.maximum(boxes1[:, None, 1], boxes2[None, :, 1])
+    x2 = np.minimum(boxes1[:, None, 2], boxes2[None, :, 2])
+    y2 = np.minimum(boxes1[:, None, 3], boxes2[None, :, 3])
+    intersection = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area1 = (boxes1[:, 2] - boxes1[:, 0]) * (boxes1[:, 3] - boxes1[:, 1])
+    area2 = (boxes2[:, 2] - boxes2[:, 0]) * (boxes2[:, 3] - boxes2[:, 1])
+    union = area1[:, None] + area2[None, :] - intersection
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(union > 0, intersection / union, 0.0)
+
+
+class KeypointTracker:
+    def __init__(self, min_iou=0.3, max_age=1.0):
+        self.min_iou = min_iou
+        self.max_age = max_age  # この秒数見失った人物は追跡をやめる
+        self.next_id = 0
+        self.track_ids = []
+        self.track_boxes = np.empty((0, 4), dtype=np.float32)
+        self.last_seen = []
+
+    def update(self, keypoints, timestamp):
+        # (N, 17, 3) のキーポイントに対応するトラックIDのリストを返す
+        boxes = keypoint_boxes(keypoints) if len(keypoints) else np.empty((0, 4), dtype=np.float32)
+        assigned = [None] * len(boxes)
+
+        if len(boxes) and len(self.track_ids):
+            iou = box_iou(self.track_boxes, boxes)
+            # IoUの大きい組から順に対応付ける
+            used_tracks = set()
+            for flat_index in np.argsort(iou, axis=None)[::-1]:
+                track_index, detection_index = np.unravel_index(flat_index, iou.shape)
+                if iou[track_index, detection_index] < self.min_iou:
+                    break
+                if assigned[detection_index] is not None or track_index in used_tracks:
+                    continue
+                assigned[detection_index] = int(track_index)
+                used_tracks.add(track_index)
+
+        track_ids = list(self.track_ids)
+        track_boxes = list(self.track_boxes)
+        last_seen = list(self.last_seen)
+        result = []
+        for detection_index, track_index in enumerate(assigned):
+            if track_index is None:
+                # 新しい人物としてIDを割り当てる
+                track_ids.append(self.next_id)
+                track_boxes.append(boxes[detection_index])
+                last_seen.append(timestamp)
+                result.append(self.next_id)
+                self.next_id += 1
+            else:
+                track_boxes[track_index] = boxes[detection_index]
+                last_seen[track_index] = timestamp
+                result.append(track_ids[track_index])
+
+        # 一定時間見失ったトラックを削除
+        alive = [i for i, seen in enumerate(last_seen) if timestamp - seen <= self.max_age]
+        self.track_ids = [track_ids[i] for i in alive]
+        self.track_boxes = np.array([track_boxes[i] for i in alive], dtype=np.float32).reshape(-1, 4)
+        self.last_seen = [last_seen[i] for i in alive]
+        return result